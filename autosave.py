@@ -0,0 +1,83 @@
+import time
+import threading
+from config import AUTOSAVE_INTERVAL, write_json_atomic, remove_file, resolve
+
+
+class AutosaveWriter:
+    def __init__(self, interval=AUTOSAVE_INTERVAL):
+        self.interval = interval
+        self.writes = 0
+        self.bytes_written = 0
+        self.skipped = 0
+        self.errors = 0
+        self._pending = {}
+        self._written = {}
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def submit(self, changes):
+        if not changes:
+            return
+        with self._lock:
+            self._pending.update(changes)
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wakeup.wait()
+            delay = self._last_flush + self.interval - time.monotonic()
+            if delay > 0 and self._stop_event.wait(delay):
+                return
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._wakeup.clear()
+            for path, data in pending.items():
+                try:
+                    data = resolve(data)
+                except Exception:
+                    self.errors += 1
+                    self._written.pop(path, None)
+                    continue
+                if path in self._written and self._written[path] == data:
+                    self.skipped += 1
+                    continue
+                try:
+                    if data is None:
+                        remove_file(path)
+                    else:
+                        self.bytes_written += write_json_atomic(path, data)
+                except (OSError, TypeError, ValueError):
+                    self.errors += 1
+                    self._written.pop(path, None)
+                    continue
+                self._written[path] = data
+                self.writes += 1
+            self._last_flush = time.monotonic()
+
+    def stats(self):
+        return {
+            "writes": self.writes,
+            "bytes": self.bytes_written,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "pending": len(self._pending),
+        }
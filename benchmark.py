@@ -0,0 +1,472 @@
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import random
+import struct
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+import gc
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+import init
+from music_utils import validate_and_get_music_files, probe_duration, get_duration, _duration_cache
+from playlist import compare_and_update_playlist, create_ordered_playlist, encode_playlist_state, new_playlist_seed
+from phone_sync import (
+    MAX_WORKERS, AdbShell, AdbShellPool, chunk_shell_args, list_phone_files, list_phone_stats, touch_phone_file,
+    touch_phone_files,
+)
+
+DEFAULT_SIZES = (100, 1000, 10000, 50000)
+FORMATS = (".wav", ".flac", ".ogg")
+PLAYLIST_MEMORY_MAX_RATIO = 0.45
+WORDS = (
+    "night", "river", "blue", "summer", "rain", "city", "light", "echo", "dream", "fire",
+    "ocean", "star", "wind", "heart", "road", "moon", "silver", "winter", "song", "gold",
+    "晴天", "夜曲", "稻香", "光年", "海阔天空", "后来", "小幸运", "平凡之路",
+)
+JUNK_TAGS = {
+    "album": "Unknown Album",
+    "genre": "Other",
+    "albumartist": "Various Artists",
+    "tracknumber": "1/12",
+    "description": "ripped by someone",
+    "subtitle": "Live",
+}
+ID3_FRAMES = {
+    "title": "TIT2", "artist": "TPE1", "album": "TALB", "genre": "TCON",
+    "albumartist": "TPE2", "tracknumber": "TRCK", "subtitle": "TIT3",
+}
+
+
+def syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def vorbis_comment(tags):
+    vendor = b"benchmark"
+    data = struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", len(tags))
+    for key, value in tags.items():
+        entry = f"{key.upper()}={value}".encode("utf-8")
+        data += struct.pack("<I", len(entry)) + entry
+    return data
+
+
+def make_wav(tags, payload, rate=8000):
+    fmt = struct.pack("<HHIIHH", 1, 1, rate, rate * 2, 2, 16)
+    frames = b"".join(
+        ID3_FRAMES[key].encode("ascii") + syncsafe(len(value.encode("utf-8")) + 1) + b"\0\0\x03" + value.encode("utf-8")
+        for key, value in tags.items() if key in ID3_FRAMES
+    )
+    id3 = b"ID3\x04\x00\x00" + syncsafe(len(frames)) + frames
+    if len(id3) % 2:
+        id3 += b"\0"
+    chunks = (
+        b"fmt " + struct.pack("<I", len(fmt)) + fmt
+        + b"data" + struct.pack("<I", payload) + b"\0" * payload
+        + b"id3 " + struct.pack("<I", len(id3)) + id3
+    )
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def make_flac(tags, payload, seconds=180.0, rate=44100):
+    info = (rate << 44) | (1 << 41) | (15 << 36) | int(seconds * rate)
+    streaminfo = struct.pack(">HH", 4096, 4096) + b"\0" * 6 + info.to_bytes(8, "big") + b"\0" * 16
+    comment = vorbis_comment(tags)
+    padding = b"\0" * 1024
+    blocks = b""
+    for block_type, data, last in ((0, streaminfo, False), (4, comment, False), (1, padding, True)):
+        blocks += bytes([(0x80 if last else 0) | block_type]) + len(data).to_bytes(3, "big") + data
+    return b"fLaC" + blocks + b"\xff\xf8" + b"\0" * payload
+
+
+def make_ogg(tags, payload, seconds=180.0, rate=44100):
+    from mutagen.ogg import OggPage
+
+    ident = b"\x01vorbis" + struct.pack("<IBIiii", 0, 2, rate, 0, 128000, 0) + b"\xb8\x01"
+    comment = b"\x03vorbis" + vorbis_comment(tags) + b"\x01"
+    setup = b"\x05vorbis" + b"\0" * 32
+    pages = [OggPage(), OggPage()]
+    pages[0].packets, pages[0].first = [ident], True
+    pages[1].packets, pages[1].sequence = [comment, setup], 1
+    pages.extend(OggPage.from_packets([b"\0" * payload], sequence=2))
+    for page in pages:
+        page.serial = 1
+    pages[-1].position, pages[-1].last = int(seconds * rate), True
+    return b"".join(page.write() for page in pages)
+
+
+BUILDERS = {".wav": make_wav, ".flac": make_flac, ".ogg": make_ogg}
+
+
+def generate_library(folder, count, seed=0, payload=4096):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    names = []
+    for i in range(count):
+        ext = FORMATS[i % len(FORMATS)]
+        artist = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 2))).title()
+        title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        name = f"{artist} - {title} {i:05d}{ext}"
+        names.append(name)
+        tags = dict(JUNK_TAGS, title=title.lower(), artist="Unknown Artist")
+        with open(os.path.join(folder, name), "wb") as f:
+            f.write(BUILDERS[ext](tags, payload))
+    return names
+
+
+def measure(fn, repeat):
+    runs, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        runs.append(time.perf_counter() - start)
+    return runs, result
+
+
+def summarize(runs, items, **extra):
+    summary = {
+        "runs": [round(r, 6) for r in runs],
+        "min": round(min(runs), 6),
+        "median": round(statistics.median(runs), 6),
+        "items": items,
+        "per_item_us": round(min(runs) / max(1, items) * 1e6, 3),
+    }
+    summary.update(extra)
+    return summary
+
+
+def bench_scan(ctx):
+    runs, files = measure(lambda: validate_and_get_music_files(ctx["folder"]), ctx["repeat"])
+    ctx["files"] = files
+    return summarize(runs, len(files))
+
+
+def bench_normalize(ctx):
+    runs, report = measure(lambda: init.process_music_folder_three_steps(ctx["folder"]), 1)
+    statuses = {}
+    for item in report:
+        statuses[item["status"]] = statuses.get(item["status"], 0) + 1
+    written = sum(item.get("bytes_written", 0) for item in report)
+    cold = summarize(runs, len(report), statuses=statuses, bytes_written=written)
+    runs, report = measure(lambda: init.process_music_folder_three_steps(ctx["folder"]), ctx["repeat"])
+    warm = summarize(runs, len(report))
+    return {"cold": cold, "warm": warm}
+
+
+def bench_playlist_diff(ctx):
+    files = ctx["files"]
+    rng = random.Random(ctx["seed"])
+    churn = max(1, len(files) // 20)
+    removed = set(rng.sample(files, churn))
+    added = [os.path.join(ctx["folder"], f"New Artist - New Song {i:05d}.flac") for i in range(churn)]
+    new_files = [path for path in files if path not in removed] + added
+    results = {}
+    for mode in ("sequential", "random"):
+        seed = new_playlist_seed()
+        old = create_ordered_playlist(files, mode, seed, ctx["folder"])
+        runs, _ = measure(
+            lambda: compare_and_update_playlist(old, new_files, len(old) // 2, mode, seed, ctx["folder"]),
+            ctx["repeat"],
+        )
+        results[mode] = summarize(runs, len(new_files), churn=churn)
+    return results
+
+
+def traced(build):
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current, peak
+
+
+def bench_playlist_memory(ctx):
+    files = ctx["files"]
+
+    def fresh_paths():
+        return [path.encode("utf-8", "surrogatepass").decode("utf-8", "surrogatepass") for path in files]
+
+    _, list_bytes, _ = traced(fresh_paths)
+    results = {"path_list": {"bytes": list_bytes, "per_item_bytes": round(list_bytes / max(1, len(files)), 1)}}
+    for mode in ("sequential", "random"):
+        seed = new_playlist_seed()
+        playlist, current, peak = traced(lambda: create_ordered_playlist(fresh_paths(), mode, seed, ctx["folder"]))
+        results[mode] = {
+            "bytes": current,
+            "peak_bytes": peak,
+            "per_item_bytes": round(current / max(1, len(playlist)), 1),
+            "list_ratio": round(current / max(1, list_bytes), 3),
+        }
+    return results
+
+
+FAKE_ADB = """
+import os, sys, time, shutil
+time.sleep(float(os.environ.get("FAKE_ADB_LATENCY", "0")))
+args = sys.argv[1:]
+if args[:1] == ["devices"]:
+    print("List of devices attached")
+    print("fake\\tdevice")
+elif args[:1] == ["shell"]:
+    os.execvp("sh", ["sh"] if len(args) == 1 else ["sh", "-c", " ".join(args[1:])])
+elif args[:1] == ["push"]:
+    os.makedirs(os.path.dirname(args[2]), exist_ok=True)
+    shutil.copyfile(args[1], args[2])
+else:
+    sys.exit(1)
+"""
+
+
+def install_fake_adb(workdir, latency):
+    bin_dir = os.path.join(workdir, "fake_adb")
+    os.makedirs(bin_dir, exist_ok=True)
+    adb = os.path.join(bin_dir, "adb")
+    with open(adb, "w", encoding="utf-8") as f:
+        f.write(f"#!{sys.executable}\n{FAKE_ADB}")
+    os.chmod(adb, 0o755)
+    os.environ["PATH"] = bin_dir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["FAKE_ADB_LATENCY"] = str(latency)
+
+
+def bench_adb(ctx):
+    if sys.platform == "win32":
+        return {"skipped": "the fake adb needs a POSIX shell"}
+    original_path = os.environ.get("PATH", "")
+    install_fake_adb(ctx["workdir"], ctx["adb_latency"])
+    phone = os.path.join(ctx["workdir"], "phone")
+    os.makedirs(phone, exist_ok=True)
+    names = [os.path.basename(path) for path in ctx["files"][:ctx["adb_limit"]]]
+    for name in names:
+        open(os.path.join(phone, name), "wb").close()
+    time_str = config.get_timestr()
+
+    def spawn_each():
+        for name in names:
+            command = f"touch -c -t {time_str} {shlex.quote(phone + '/' + name)}"
+            subprocess.run(["adb", "shell", command], capture_output=True, timeout=10)
+
+    def one_session():
+        with AdbShell() as shell:
+            for name in names:
+                touch_phone_file(phone, name, time_str, shell)
+
+    def pooled():
+        with AdbShellPool() as pool, ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            list(executor.map(lambda name: touch_phone_file(phone, name, time_str, pool), names))
+
+    def batched():
+        with AdbShellPool() as pool:
+            touch_phone_files(phone, names, time_str, pool)
+
+    try:
+        results = {}
+        batches = len(list(chunk_shell_args(f"{phone}/{name}" for name in names)))
+        for name, run, round_trips in (
+            ("touch_spawn", spawn_each, len(names)), ("touch_session", one_session, len(names)),
+            ("touch_pool", pooled, len(names)), ("touch_batch", batched, batches),
+        ):
+            runs, _ = measure(run, ctx["repeat"])
+            results[name] = summarize(runs, len(names), round_trips=round_trips)
+        runs, listed = measure(lambda: list_phone_files(phone), ctx["repeat"])
+        results["list"] = summarize(runs, len(listed))
+        runs, stats = measure(lambda: list_phone_stats(phone), ctx["repeat"])
+        results["list_stats"] = summarize(runs, len(stats))
+    finally:
+        os.environ["PATH"] = original_path
+        shutil.rmtree(phone, ignore_errors=True)
+    return results
+
+
+def bench_app_data(ctx):
+    files, folder = ctx["files"], ctx["folder"]
+    seed = new_playlist_seed()
+    playlist = create_ordered_playlist(files, "random", seed, folder)
+    variants = {
+        "compact": encode_playlist_state(playlist, folder, files, "random", seed, len(files) // 2, 12.5),
+        "legacy": {"song_list": list(playlist), "last_index": len(files) // 2, "last_position": 12.5, "play_mode": "random"},
+    }
+    results = {}
+    original = config.APP_DATA_FILE, config.PLAYLIST_DIR
+    try:
+        for name, state in variants.items():
+            config.APP_DATA_FILE = os.path.join(ctx["workdir"], f"settings_{name}.json")
+            config.PLAYLIST_DIR = os.path.join(ctx["workdir"], f"playlists_{name}")
+            save_runs, _ = measure(
+                lambda: config.save_app_data(1.0, folder, "random", {folder: state}, {}), ctx["repeat"]
+            )
+            load_runs, _ = measure(lambda: config.load_app_data()["playlists"][folder], ctx["repeat"])
+            shard = config.PlaylistStore().shard_path(folder)
+            results[name] = {
+                "save": summarize(save_runs, len(files)),
+                "load": summarize(load_runs, len(files)),
+                "file_bytes": os.path.getsize(config.APP_DATA_FILE) + os.path.getsize(shard),
+            }
+    finally:
+        config.APP_DATA_FILE, config.PLAYLIST_DIR = original
+    return results
+
+
+def bench_duration(ctx):
+    sample = ctx["files"][:ctx["probe_limit"]]
+    probe_runs, _ = measure(lambda: [probe_duration(path) for path in sample], 1)
+    _duration_cache.clear()
+    cold_runs, _ = measure(lambda: [get_duration(path) for path in sample], 1)
+    warm_runs, _ = measure(lambda: [get_duration(path) for path in sample], ctx["repeat"])
+    return {
+        "probe": summarize(probe_runs, len(sample)),
+        "cached_cold": summarize(cold_runs, len(sample)),
+        "cached_warm": summarize(warm_runs, len(sample)),
+    }
+
+
+BENCHMARKS = {
+    "scan": bench_scan,
+    "normalize": bench_normalize,
+    "playlist_diff": bench_playlist_diff,
+    "playlist_memory": bench_playlist_memory,
+    "app_data": bench_app_data,
+    "duration": bench_duration,
+    "adb": bench_adb,
+}
+
+
+def git_revision():
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+        return result.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def run_benchmarks(sizes, selected, repeat=3, seed=0, payload=4096, probe_limit=2000, workdir=None, keep=False,
+                   adb_limit=500, adb_latency=0.0):
+    root = workdir or tempfile.mkdtemp(prefix="music_bench_")
+    original_manifest_dir = init.MANIFEST_DIR
+    init.MANIFEST_DIR = os.path.join(root, "manifests")
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "repeat": repeat,
+            "seed": seed,
+            "payload_bytes": payload,
+        },
+        "sizes": {},
+    }
+    try:
+        for size in sizes:
+            folder = os.path.join(root, f"library_{size}")
+            start = time.perf_counter()
+            generate_library(folder, size, seed, payload)
+            ctx = {
+                "folder": folder, "workdir": root, "repeat": repeat, "seed": seed,
+                "probe_limit": probe_limit, "adb_limit": adb_limit, "adb_latency": adb_latency, "files": None,
+            }
+            entry = {"generate_s": round(time.perf_counter() - start, 3)}
+            if "scan" not in selected:
+                ctx["files"] = validate_and_get_music_files(folder)
+            for name, bench in BENCHMARKS.items():
+                if name in selected:
+                    entry[name] = bench(ctx)
+                    print(f"[{size}] {name} done", file=sys.stderr)
+            results["sizes"][str(size)] = entry
+            if not keep:
+                shutil.rmtree(folder, ignore_errors=True)
+    finally:
+        init.MANIFEST_DIR = original_manifest_dir
+        if not keep and workdir is None:
+            shutil.rmtree(root, ignore_errors=True)
+    return results
+
+
+def flatten(tree, prefix=""):
+    values = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            if "min" in value and "runs" in value:
+                values[path] = value["min"]
+            elif "per_item_bytes" in value:
+                values[path] = value["per_item_bytes"]
+            else:
+                values.update(flatten(value, path))
+    return values
+
+
+def compare(baseline, current):
+    old, new = flatten(baseline["sizes"]), flatten(current["sizes"])
+    for key in sorted(set(old) & set(new), key=lambda k: (int(k.split(".")[0]), k)):
+        ratio = new[key] / old[key] if old[key] else float("inf")
+        print(f"{key:50s} {old[key]:12.6f} {new[key]:12.6f} {ratio:8.2f}x")
+
+
+def check(results, max_ratio=PLAYLIST_MEMORY_MAX_RATIO):
+    failures = []
+    for size, entry in results["sizes"].items():
+        for mode in ("sequential", "random"):
+            ratio = entry.get("playlist_memory", {}).get(mode, {}).get("list_ratio")
+            if ratio is not None and ratio > max_ratio:
+                failures.append(f"[{size}] playlist_memory.{mode}: {ratio:.3f}x of path_list > {max_ratio:.3f}x")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the music player's hot paths on synthetic libraries.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), default=sorted(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--payload", type=int, default=4096, help="audio payload bytes per file")
+    parser.add_argument("--probe-limit", type=int, default=2000, help="max files for duration probing")
+    parser.add_argument("--adb-limit", type=int, default=500, help="max files for the fake adb benchmark")
+    parser.add_argument("--adb-latency", type=float, default=0.0, help="simulated adb process startup delay (s)")
+    parser.add_argument("--workdir", help="directory for generated libraries (default: a temp dir)")
+    parser.add_argument("--keep", action="store_true", help="keep generated libraries")
+    parser.add_argument("-o", "--output", help="write JSON results to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--check", type=float, nargs="?", const=PLAYLIST_MEMORY_MAX_RATIO, metavar="RATIO",
+                        help="fail if a playlist uses more than RATIO of the list-of-str footprint "
+                             f"(default: {PLAYLIST_MEMORY_MAX_RATIO})")
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.sizes, set(args.only), args.repeat, args.seed, args.payload,
+        args.probe_limit, args.workdir, args.keep, args.adb_limit, args.adb_latency,
+    )
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), results)
+    if args.check is not None:
+        failures = check(results, args.check)
+        for failure in failures:
+            print(f"FAIL {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
 import os
 import json
+import hashlib
+import tempfile
+import threading
 import datetime
 
 APP_DATA_FILE = os.path.join(os.path.expanduser("~"), "settings.json")
+LIBRARY_DB_FILE = os.path.join(os.path.expanduser("~"), "music_library.db")
+MANIFEST_DIR = os.path.join(os.path.expanduser("~"), ".music_manifests")
+PLAYLIST_DIR = os.path.join(os.path.expanduser("~"), ".music_playlists")
 SCREEN_WIDTH = 600
 SCREEN_HEIGHT = 520
 TEXT_COLOR = (230, 230, 240)
@@ -26,6 +32,25 @@ MIN_PROGRESS_BAR_PADDING = 45
 FAST_FORWARD_REWIND_STEP = 10
 SCROLL_DELAY_DURATION = 2000
 SUPPORTED_FORMATS = (".flac", ".mp3", ".wav", ".ogg", ".m4a")
+SCAN_RECURSIVE = True
+SCAN_MAX_DEPTH = None
+SCAN_EXCLUDE = (".*", "$RECYCLE.BIN", "System Volume Information")
+WATCH_INTERVAL = 2.0
+DURATION_CACHE_SIZE = 4096
+PRELOAD_LOOKAHEAD = 16
+VALIDATE_BATCH = 64
+VALIDATE_AHEAD = 512
+FPS_ACTIVE = 60
+FPS_ANIMATING = 30
+FPS_PLAYING = 10
+FPS_IDLE = 4
+FPS_HIDDEN = 2
+INPUT_ACTIVE_MS = 1500
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = 47821
+CONTROL_TIMEOUT = 5.0
+CONTROL_TOKEN_FILE = os.path.join(os.path.expanduser("~"), ".music_control_token")
+AUTOSAVE_INTERVAL = 5.0
 
 
 def get_datetime():
@@ -37,34 +62,190 @@ def get_timestr():
     return get_datetime().strftime("%Y%m%d%H%M")
 
 
+def write_json_atomic(path, data):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    payload = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    fd, temp_path = tempfile.mkstemp(prefix=".tmp-", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return len(payload)
+
+
+def folder_shard_path(directory, folder):
+    key = os.path.normcase(os.path.abspath(folder))
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(directory, f"{digest}.json")
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class Deferred:
+    def __init__(self, build):
+        self._build = build
+        self._value = None
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            if self._build is not None:
+                self._value, self._build = self._build(), None
+            return self._value
+
+
+def resolve(value):
+    return value() if isinstance(value, Deferred) else value
+
+
+def playlist_shard(folder, state):
+    if isinstance(state, Deferred):
+        return Deferred(lambda: {"folder": folder, "state": state()})
+    return {"folder": folder, "state": state}
+
+
+class PlaylistStore:
+    def __init__(self, directory=None):
+        self.directory = directory or PLAYLIST_DIR
+        self._cache = {}
+        self._dirty = set()
+        self._deleted = set()
+        self._removals = set()
+
+    def shard_path(self, folder):
+        return folder_shard_path(self.directory, folder)
+
+    def _load(self, folder):
+        if folder in self._cache:
+            return resolve(self._cache[folder])
+        if folder in self._deleted:
+            return None
+        try:
+            with open(self.shard_path(folder), "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if not isinstance(data, dict) or data.get("folder") != folder:
+            return None
+        self._cache[folder] = data.get("state")
+        return self._cache[folder]
+
+    def __contains__(self, folder):
+        if folder in self._cache:
+            return self._cache[folder] is not None
+        return self._load(folder) is not None
+
+    def __getitem__(self, folder):
+        state = self._load(folder)
+        if state is None:
+            raise KeyError(folder)
+        return state
+
+    def get(self, folder, default=None):
+        state = self._load(folder)
+        return default if state is None else state
+
+    def __setitem__(self, folder, state):
+        self._cache[folder] = state
+        self._dirty.add(folder)
+        self._deleted.discard(folder)
+        self._removals.discard(folder)
+
+    def __delitem__(self, folder):
+        if folder not in self:
+            raise KeyError(folder)
+        self._cache.pop(folder, None)
+        self._dirty.discard(folder)
+        self._deleted.add(folder)
+        self._removals.add(folder)
+
+    def update(self, states):
+        for folder, state in states.items():
+            self[folder] = state
+
+    def take_changes(self):
+        changes = {
+            self.shard_path(folder): playlist_shard(folder, self._cache[folder])
+            for folder in self._dirty
+        }
+        changes.update((self.shard_path(folder), None) for folder in self._removals)
+        self._dirty.clear()
+        self._removals.clear()
+        return changes
+
+    def save(self):
+        for path, data in self.take_changes().items():
+            if data is None:
+                remove_file(path)
+            else:
+                write_json_atomic(path, resolve(data))
+
+
+def migrate_legacy_playlists(data, store):
+    legacy = data.pop("playlists", None)
+    if not isinstance(legacy, dict):
+        return
+    store.update(legacy)
+    try:
+        store.save()
+        write_json_atomic(APP_DATA_FILE, data)
+    except OSError:
+        pass
+
+
 def load_app_data():
     default_data = {
         "global_volume": 1.0,
         "last_active_folder": "",
         "next_new_playlist_mode": "random",
-        "playlists": {},
         "phone_mappings": {},
     }
+    store = PlaylistStore()
     try:
         with open(APP_DATA_FILE, "r", encoding="utf-8") as f:
             data = json.load(f)
-        for key, value in default_data.items():
-            data.setdefault(key, value)
-        return data
+        if not isinstance(data, dict):
+            data = dict(default_data)
     except (FileNotFoundError, json.JSONDecodeError):
-        return default_data
+        data = dict(default_data)
+    migrate_legacy_playlists(data, store)
+    for key, value in default_data.items():
+        data.setdefault(key, value)
+    data["playlists"] = store
+    return data
 
 
-def save_app_data(volume, active_folder, next_mode, playlists_data, phone_mappings):
-    data = {
+def app_settings(volume, active_folder, next_mode, phone_mappings):
+    return {
         "global_volume": volume,
         "last_active_folder": active_folder,
         "next_new_playlist_mode": next_mode,
-        "playlists": playlists_data,
         "phone_mappings": phone_mappings,
     }
+
+
+def save_app_data(volume, active_folder, next_mode, playlists_data, phone_mappings):
+    data = app_settings(volume, active_folder, next_mode, phone_mappings)
+    if not isinstance(playlists_data, PlaylistStore):
+        store = PlaylistStore()
+        store.update(playlists_data)
+        playlists_data = store
     try:
-        with open(APP_DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-    except Exception:
+        playlists_data.save()
+        write_json_atomic(APP_DATA_FILE, data)
+    except (OSError, TypeError, ValueError):
         pass
@@ -0,0 +1,162 @@
+import os
+import re
+import hmac
+import json
+import queue
+import secrets
+import threading
+import socketserver
+import pygame
+
+from config import CONTROL_HOST, CONTROL_PORT, CONTROL_TIMEOUT, CONTROL_TOKEN_FILE, FPS_IDLE
+from player_core import PlayerCore
+from playback import MUSIC_END_EVENT
+
+COMMAND_EVENT = pygame.USEREVENT + 2
+COMMANDS = ("play", "pause", "toggle", "next", "prev", "seek", "load", "volume", "mode", "status", "quit")
+MAX_LINE_BYTES = 4096
+HTTP_LINE = re.compile(r"^(GET|HEAD|POST|PUT|DELETE|OPTIONS|PATCH|CONNECT|TRACE) |^HTTP/|^[A-Za-z][\w-]*:\s")
+
+
+def load_control_token(path=CONTROL_TOKEN_FILE):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+    token = secrets.token_hex(16)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(token + "\n")
+    return token
+
+
+class ControlHandler(socketserver.StreamRequestHandler):
+    def reply(self, response):
+        self.wfile.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+        self.wfile.flush()
+
+    def handle(self):
+        authenticated = False
+        while True:
+            raw_line = self.rfile.readline(MAX_LINE_BYTES + 1)
+            if not raw_line:
+                return
+            line = raw_line.decode("utf-8", errors="replace").strip()
+            if len(raw_line) > MAX_LINE_BYTES or HTTP_LINE.match(line):
+                self.reply({"ok": False, "error": "malformed request"})
+                return
+            if not line:
+                continue
+            name, _, arg = line.partition(" ")
+            name = name.lower()
+            if not authenticated:
+                if name != "auth" or not hmac.compare_digest(arg.strip().encode(), self.server.token.encode()):
+                    self.reply({"ok": False, "error": "unauthorized"})
+                    return
+                authenticated = True
+                self.reply({"ok": True})
+                continue
+            if name not in COMMANDS:
+                self.reply({"ok": False, "error": f"unknown command: {name}"})
+                return
+            reply = {"done": threading.Event()}
+            self.server.commands.put((line, reply))
+            pygame.event.post(pygame.event.Event(COMMAND_EVENT))
+            if reply["done"].wait(CONTROL_TIMEOUT):
+                response = reply["response"]
+            else:
+                response = {"ok": False, "error": "timeout"}
+            self.reply(response)
+            if not response["ok"]:
+                return
+
+
+class ControlServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, commands, token):
+        super().__init__(address, ControlHandler)
+        self.commands = commands
+        self.token = token
+
+
+def run_command(core, line):
+    name, _, arg = line.partition(" ")
+    name, arg = name.lower(), arg.strip()
+    if name == "play":
+        if core.playback.is_paused:
+            core.handle_action("play_pause")
+    elif name == "pause":
+        if core.playback.song_playing:
+            core.handle_action("play_pause")
+    elif name == "toggle":
+        core.handle_action("play_pause")
+    elif name in ("next", "prev"):
+        core.handle_action(name)
+    elif name == "seek":
+        seconds = float(arg)
+        if core.duration > 0:
+            core.seek_music(max(0.0, min(1.0, seconds / core.duration)))
+    elif name == "load":
+        folder = os.path.abspath(os.path.expanduser(arg))
+        if not os.path.isdir(folder):
+            raise ValueError(f"not a folder: {arg}")
+        core.open_folder(folder)
+    elif name == "volume":
+        core.set_volume(float(arg))
+    elif name == "mode":
+        core.handle_action("toggle_mode")
+    elif name not in ("status", "quit"):
+        raise ValueError(f"unknown command: {name}")
+    return core.status()
+
+
+def run_daemon(host=CONTROL_HOST, port=CONTROL_PORT):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.display.init()
+    pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+    core = PlayerCore(MUSIC_END_EVENT)
+    core.start()
+
+    commands = queue.Queue()
+    server = ControlServer((host, port), commands, load_control_token())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    running = True
+    try:
+        while running:
+            event = pygame.event.wait(int(1000 / FPS_IDLE))
+            events = pygame.event.get()
+            if event.type != pygame.NOEVENT:
+                events.insert(0, event)
+            for event in events:
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == MUSIC_END_EVENT:
+                    core.on_music_end()
+
+            while True:
+                try:
+                    line, reply = commands.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    reply["response"] = {"ok": True, **run_command(core, line)}
+                except Exception as e:
+                    reply["response"] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                reply["done"].set()
+                if line.strip().lower() == "quit":
+                    running = False
+
+            core.poll()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+        core.shutdown()
+        pygame.quit()
@@ -0,0 +1,108 @@
+import os
+import threading
+from config import SCAN_RECURSIVE, SCAN_MAX_DEPTH, SCAN_EXCLUDE, WATCH_INTERVAL
+from music_utils import list_music_dir
+
+
+class FolderWatcher:
+    def __init__(self, folder, on_change, interval=WATCH_INTERVAL,
+                 recursive=SCAN_RECURSIVE, max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE, dirs=None):
+        self.folder = folder
+        self.on_change = on_change
+        self.interval = interval
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.exclude = exclude
+        self._dirs = {}
+        self._seed = dirs
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        if self._seed is None:
+            self._add_tree(self.folder, 0, [])
+        else:
+            for dir_path, (mtime_ns, depth, files, subdirs) in self._seed.items():
+                self._dirs[dir_path] = {
+                    "mtime_ns": mtime_ns, "depth": depth, "files": set(files), "subdirs": set(subdirs)
+                }
+            self._seed = None
+        while not self._stop_event.wait(self.interval):
+            try:
+                added, removed = self.poll()
+                if added or removed:
+                    self.on_change(self.folder, added, removed)
+            except Exception:
+                pass
+
+    def poll(self):
+        added, removed = [], []
+        for dir_path in list(self._dirs):
+            state = self._dirs.get(dir_path)
+            if state is None:
+                continue
+            try:
+                mtime_ns = os.stat(dir_path).st_mtime_ns
+            except OSError:
+                self._remove_tree(dir_path, removed)
+                continue
+            if mtime_ns != state["mtime_ns"]:
+                self._rescan_dir(dir_path, added, removed)
+        return added, removed
+
+    def _list_dir(self, dir_path):
+        rel_dir = os.path.relpath(dir_path, self.folder) if dir_path != self.folder else ""
+        files, subdirs = list_music_dir(dir_path, rel_dir, self.exclude)
+        return {entry.path: entry for entry in files}, subdirs
+
+    def _add_tree(self, dir_path, depth, added):
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            files, subdirs = self._list_dir(dir_path)
+        except OSError:
+            return
+        if not self.recursive or (self.max_depth is not None and depth >= self.max_depth):
+            subdirs = []
+        self._dirs[dir_path] = {
+            "mtime_ns": mtime_ns, "depth": depth, "files": set(files), "subdirs": set(subdirs)
+        }
+        added.extend(files.values())
+        for name in subdirs:
+            self._add_tree(os.path.join(dir_path, name), depth + 1, added)
+
+    def _remove_tree(self, dir_path, removed):
+        state = self._dirs.pop(dir_path, None)
+        if state is None:
+            return
+        removed.extend(state["files"])
+        for name in state["subdirs"]:
+            self._remove_tree(os.path.join(dir_path, name), removed)
+
+    def _rescan_dir(self, dir_path, added, removed):
+        state = self._dirs[dir_path]
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+            files, subdirs = self._list_dir(dir_path)
+        except OSError:
+            self._remove_tree(dir_path, removed)
+            return
+        depth = state["depth"]
+        if not self.recursive or (self.max_depth is not None and depth >= self.max_depth):
+            subdirs = []
+        new_files, new_subdirs = set(files), set(subdirs)
+        added.extend(files[path] for path in new_files - state["files"])
+        removed.extend(state["files"] - new_files)
+        for name in state["subdirs"] - new_subdirs:
+            self._remove_tree(os.path.join(dir_path, name), removed)
+        state.update(mtime_ns=mtime_ns, files=new_files, subdirs=new_subdirs)
+        for name in new_subdirs:
+            sub_path = os.path.join(dir_path, name)
+            if sub_path not in self._dirs:
+                self._add_tree(sub_path, depth + 1, added)
@@ -1,5 +1,4 @@
 import pygame
-from tkinter import Tk, Toplevel, Label, Entry, Button as TkButton
 from config import *
 
 
@@ -161,10 +160,13 @@ class MusicProgressBar(Slider):
                 return True
         return False
 
-    def draw(self, screen, current_time, duration):
+    def set_progress(self, current_time, duration):
         if not self.dragging:
             self.val = current_time / duration if duration > 0 else 0
             self._update_thumb_pos()
+
+    def draw(self, screen, current_time, duration):
+        self.set_progress(current_time, duration)
         
         pygame.draw.rect(
             screen, SLIDER_BAR_COLOR, self.rect, border_radius=self.rect.height // 2
@@ -254,7 +256,49 @@ class InputBox:
             )
 
 
+class RenderScheduler:
+    def __init__(self, screen, background_color, draw_static=None):
+        self.screen = screen
+        self.background_color = background_color
+        self.draw_static = draw_static
+        self.regions = []
+        self.full_redraw = True
+
+    def add(self, rect, state, draw):
+        self.regions.append([pygame.Rect(rect), state, draw, None])
+
+    def invalidate(self):
+        self.full_redraw = True
+
+    def render(self):
+        full_redraw, self.full_redraw = self.full_redraw, False
+        if full_redraw:
+            self.screen.fill(self.background_color)
+            if self.draw_static:
+                self.draw_static(self.screen)
+        dirty = []
+        for region in self.regions:
+            rect, state, draw, last_state = region
+            current_state = state()
+            if not full_redraw and current_state == last_state:
+                continue
+            region[3] = current_state
+            self.screen.set_clip(rect)
+            if not full_redraw:
+                self.screen.fill(self.background_color, rect)
+            draw(self.screen)
+            self.screen.set_clip(None)
+            dirty.append(rect)
+        if full_redraw:
+            pygame.display.flip()
+        elif dirty:
+            pygame.display.update(dirty)
+        return dirty
+
+
 def ask_phone_path():
+    from tkinter import Tk, Toplevel, Label, Entry, Button as TkButton
+
     root = Tk()
     root.withdraw()
     
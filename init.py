@@ -1,75 +1,283 @@
 import os
-import stat
-import win32file
-import pywintypes
-from mutagen import File as MutagenFile
-from config import SUPPORTED_FORMATS, get_datetime
+import io
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from config import MANIFEST_DIR, folder_shard_path, get_datetime, write_json_atomic
+from music_utils import scan_music_files
+from timestamps import TIME_TOLERANCE_NS, stamp_files, to_ns
 
-def process_music_folder_three_steps(folder_path):
-    if not os.path.isdir(folder_path):
-        return
-    
-    music_files = [f for f in os.listdir(folder_path) 
-                   if f.lower().endswith(SUPPORTED_FORMATS)]
-    
-    if not music_files:
-        return
-
-    for filename in music_files:
-        file_path = os.path.join(folder_path, filename)
-        try:
-            name_without_ext = os.path.splitext(filename)[0]
-            if '-' in name_without_ext:
-                artist, title = name_without_ext.rsplit('-', 1)
-                artist = artist.strip()
-                title = title.strip()
-                
-                audio = MutagenFile(file_path, easy=True)
-                if audio is not None:
+MAX_WORKERS = os.cpu_count() or 4
+FIELDS_TO_DELETE = ('subtitle', 'description', 'albumartist', 'album', 'genre', 'tracknumber')
+TAG_PADDING = 16 * 1024
+ID3_FRAMES = {
+    'title': 'TIT2', 'artist': 'TPE1', 'album': 'TALB', 'genre': 'TCON',
+    'albumartist': 'TPE2', 'tracknumber': 'TRCK', 'subtitle': 'TIT3',
+}
+
+
+class WriteCountingFile:
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+        self.bytes_written = 0
+
+    def write(self, data):
+        self.bytes_written += len(data)
+        return self._fileobj.write(data)
+
+    def fileno(self):
+        raise io.UnsupportedOperation("fileno")
+
+    def __getattr__(self, name):
+        return getattr(self._fileobj, name)
+
+
+class ID3TagView:
+    def __init__(self, audio):
+        if audio.tags is None:
+            audio.add_tags()
+        self.audio = audio
+
+    def get(self, key, default=None):
+        frame = self.audio.tags.get(ID3_FRAMES.get(key, ""))
+        return [str(text) for text in frame.text] if frame else default
+
+    def __contains__(self, key):
+        return key in ID3_FRAMES and bool(self.audio.tags.getall(ID3_FRAMES[key]))
+
+    def __setitem__(self, key, value):
+        from mutagen.id3 import Frames
+
+        frame_id = ID3_FRAMES[key]
+        self.audio.tags.setall(frame_id, [Frames[frame_id](encoding=3, text=[value])])
+
+    def __delitem__(self, key):
+        self.audio.tags.delall(ID3_FRAMES[key])
+
+    def save(self, fileobj, padding=None):
+        self.audio.save(fileobj, padding=padding)
+
+
+def reserve_padding(info):
+    if info.padding >= 0:
+        return info.padding
+    return TAG_PADDING
+
+
+def save_in_place(audio, file_path):
+    with open(file_path, "rb+") as f:
+        counter = WriteCountingFile(f)
+        audio.save(counter, padding=reserve_padding)
+    return counter.bytes_written
+
+
+def parse_artist_title(filename):
+    name_without_ext = os.path.splitext(filename)[0]
+    if '-' not in name_without_ext:
+        return None, None
+    artist, title = name_without_ext.rsplit('-', 1)
+    return artist.strip(), title.strip()
+
+
+def normalize_file(file_path):
+    start = time.perf_counter()
+    result = {"file": os.path.basename(file_path), "path": file_path, "status": "unchanged", "error": None, "bytes_written": 0}
+    try:
+        from mutagen import File as MutagenFile
+        from mutagen.wave import WAVE
+
+        audio = MutagenFile(file_path, easy=True)
+        if isinstance(audio, WAVE):
+            audio = ID3TagView(audio)
+        if audio is None:
+            result["status"] = "skipped"
+        else:
+            changed = False
+            artist, title = parse_artist_title(os.path.basename(file_path))
+            if title is not None:
+                if audio.get('title') != [title]:
                     audio['title'] = title
+                    changed = True
+                if audio.get('artist') != [artist]:
                     audio['artist'] = artist
-                    audio.save()
-        except ValueError:
-            pass
-        except Exception:
-            pass
-
-    fields_to_delete = ['subtitle', 'description', 'albumartist', 'album', 'genre', 'tracknumber']
-    for filename in music_files:
-        file_path = os.path.join(folder_path, filename)
-        try:
-            audio = MutagenFile(file_path, easy=True)
-            if audio is not None:
-                for field in fields_to_delete:
-                    if field.lower() in audio:
-                        del audio[field.lower()]
-                audio.save()
-        except Exception:
-            pass
+                    changed = True
+            for field in FIELDS_TO_DELETE:
+                if field in audio:
+                    del audio[field]
+                    changed = True
+            if changed:
+                result["bytes_written"] = save_in_place(audio, file_path)
+                result["status"] = "updated"
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["elapsed"] = time.perf_counter() - start
+    return result
+
+
+def normalize_files(file_paths, max_workers=None, progress_callback=None, is_busy=None, cancel_event=None):
+    workers = max_workers or MAX_WORKERS
+    total = len(file_paths)
+    results, deferred = [], []
+
+    def report(result):
+        results.append(result)
+        if progress_callback:
+            progress_callback(len(results) + len(deferred), total)
+
+    def take(path):
+        if is_busy and is_busy(path):
+            deferred.append(path)
+            return False
+        return True
+
+    if workers <= 1 or total <= 1:
+        for path in file_paths:
+            if cancel_event and cancel_event.is_set():
+                break
+            if take(path):
+                report(normalize_file(path))
+    else:
+        paths = iter(file_paths)
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            while True:
+                while len(pending) < workers * 4 and not (cancel_event and cancel_event.is_set()):
+                    path = next(paths, None)
+                    if path is None:
+                        break
+                    if take(path):
+                        pending.add(executor.submit(normalize_file, path))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    report(future.result())
+
+    for path in deferred:
+        if cancel_event and cancel_event.is_set():
+            break
+        if is_busy(path):
+            results.append({
+                "file": os.path.basename(path), "path": path, "status": "deferred", "error": None, "bytes_written": 0, "elapsed": 0.0
+            })
+        else:
+            results.append(normalize_file(path))
+    return results
+
+
+def tag_fingerprint(filename):
+    artist, title = parse_artist_title(os.path.basename(filename))
+    key = "\0".join([artist or "", title or "", ",".join(FIELDS_TO_DELETE)])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+
+def get_manifest_path(folder_path):
+    return folder_shard_path(MANIFEST_DIR, folder_path)
+
+
+def load_manifest(folder_path):
+    try:
+        with open(get_manifest_path(folder_path), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("files", {})
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        return {}
+
+
+def save_manifest(folder_path, files):
+    try:
+        write_json_atomic(get_manifest_path(folder_path), {"folder": folder_path, "files": files})
+    except (OSError, TypeError, ValueError):
+        pass
+
+
+def normalize_music_folder(folder_path, max_workers=None, progress_callback=None, is_busy=None, cancel_event=None, dirs=None):
+    if not os.path.isdir(folder_path):
+        return [], []
+
+    entries = {entry.relpath: entry for entry in scan_music_files(folder_path, dirs=dirs)}
+
+    manifest = load_manifest(folder_path)
+    manifest_changed = set(manifest) - set(entries)
+    for name in manifest_changed:
+        del manifest[name]
+
+    if not entries:
+        if manifest_changed:
+            save_manifest(folder_path, manifest)
+        return [], []
 
     target_time = get_datetime()
-    win_time = pywintypes.Time(target_time)
-    
-    for filename in music_files:
-        file_path = os.path.join(folder_path, filename)
-        handle = None
+    target_ns = to_ns(target_time)
+    report = []
+    to_normalize, to_stamp = [], []
+    for name, entry in entries.items():
+        record = manifest.get(name)
+        tags_ok = (
+            record is not None
+            and record.get("size") == entry.size
+            and record.get("mtime_ns") == entry.mtime_ns
+            and record.get("fingerprint") == tag_fingerprint(name)
+        )
+        time_ok = abs(entry.mtime_ns - target_ns) < TIME_TOLERANCE_NS
+        if not tags_ok:
+            to_normalize.append(name)
+        elif not time_ok:
+            to_stamp.append(name)
+        else:
+            report.append({"file": name, "status": "cached", "error": None, "bytes_written": 0, "elapsed": 0.0})
+
+    if not to_normalize and not to_stamp:
+        if manifest_changed:
+            save_manifest(folder_path, manifest)
+        return report, list(entries.values())
+
+    normalized = normalize_files(
+        [os.path.join(folder_path, name) for name in to_normalize],
+        max_workers, progress_callback, is_busy, cancel_event
+    )
+    names_by_path = {os.path.join(folder_path, name): name for name in to_normalize}
+    for result in normalized:
+        result["file"] = names_by_path[result.pop("path")]
+    if cancel_event and cancel_event.is_set():
+        return report + normalized, list(entries.values())
+    failed = {r["file"] for r in normalized if r["status"] == "deferred"}
+    for name in to_stamp:
+        normalized.append({"file": name, "status": "stamped", "error": None, "bytes_written": 0, "elapsed": 0.0})
+    to_stamp.extend(name for name in to_normalize if name not in failed)
+
+    start = time.perf_counter()
+    stamp_errors = stamp_files(folder_path, to_stamp, target_time)["errors"]
+    stamp_elapsed = (time.perf_counter() - start) / max(1, len(to_stamp))
+
+    for result in normalized:
+        name = result["file"]
+        file_path = os.path.join(folder_path, name)
+        if name in failed:
+            manifest.pop(name, None)
+            continue
+        result["elapsed"] += stamp_elapsed
+        if name in stamp_errors:
+            result["status"] = "error"
+            result["error"] = stamp_errors[name]
         try:
-            if not os.access(file_path, os.W_OK):
-                os.chmod(file_path, stat.S_IWRITE)
-
-            handle = win32file.CreateFile(
-                file_path, 
-                win32file.GENERIC_WRITE,
-                win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE, 
-                None,
-                win32file.OPEN_EXISTING, 
-                win32file.FILE_ATTRIBUTE_NORMAL, 
-                None
-            )
-            win32file.SetFileTime(handle, win_time, win_time, win_time)
-
-        except Exception:
-            pass
-        finally:
-            if handle:
-                win32file.CloseHandle(handle)
\ No newline at end of file
+            st = os.stat(file_path)
+        except OSError:
+            manifest.pop(name, None)
+            entries.pop(name, None)
+            continue
+        manifest[name] = {
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "fingerprint": tag_fingerprint(name),
+        }
+        entries[name] = entries[name]._replace(size=st.st_size, mtime_ns=st.st_mtime_ns)
+    report.extend(normalized)
+    save_manifest(folder_path, manifest)
+    return report, list(entries.values())
+
+
+def process_music_folder_three_steps(folder_path, max_workers=None, progress_callback=None, is_busy=None, cancel_event=None):
+    return normalize_music_folder(folder_path, max_workers, progress_callback, is_busy, cancel_event)[0]
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import threading
+from config import LIBRARY_DB_FILE
+from music_utils import MusicEntry, scan_music_files
+
+
+def probe_track(path):
+    try:
+        from mutagen import File as MutagenFile
+
+        audio = MutagenFile(path, easy=True)
+    except Exception:
+        audio = None
+    if audio is None:
+        return None, None, None, None
+    info = getattr(audio, "info", None)
+    duration = getattr(info, "length", None)
+    sample_rate = getattr(info, "sample_rate", None)
+    tags = audio.tags or {}
+    artist = (tags.get("artist") or [None])[0]
+    title = (tags.get("title") or [None])[0]
+    return duration, sample_rate, artist, title
+
+
+class LibraryIndex:
+    def __init__(self, db_path=LIBRARY_DB_FILE):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tracks ("
+                "folder TEXT NOT NULL, relpath TEXT NOT NULL, size INTEGER, mtime_ns INTEGER, "
+                "duration REAL, sample_rate INTEGER, artist TEXT, title TEXT, "
+                "PRIMARY KEY (folder, relpath)) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS folders (folder TEXT PRIMARY KEY, track_count INTEGER)"
+            )
+
+    def is_indexed(self, folder):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM folders WHERE folder = ?", (folder,)
+            ).fetchone()
+        return row is not None
+
+    def get_entries(self, folder):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT relpath, size, mtime_ns FROM tracks WHERE folder = ?", (folder,)
+            ).fetchall()
+        return [
+            MusicEntry(os.path.join(folder, relpath), relpath, os.path.basename(relpath), size, mtime_ns)
+            for relpath, size, mtime_ns in rows
+        ]
+
+    def get_paths(self, folder):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT relpath FROM tracks WHERE folder = ?", (folder,)
+            ).fetchall()
+        prefix = os.path.join(folder, "")
+        return [prefix + relpath for relpath, in rows]
+
+    def get_track(self, path):
+        folder, relpath = self._split(path)
+        if folder is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, duration, sample_rate, artist, title FROM tracks "
+                "WHERE folder = ? AND relpath = ?",
+                (folder, relpath),
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("size", "mtime_ns", "duration", "sample_rate", "artist", "title"), row))
+
+    def get_duration(self, path):
+        track = self.get_track(path)
+        return track["duration"] if track else None
+
+    def update_folder(self, folder, entries=None):
+        if entries is None:
+            entries = scan_music_files(folder)
+        current = {entry.relpath: entry for entry in entries}
+        with self._lock:
+            stored = {
+                relpath: (size, mtime_ns)
+                for relpath, size, mtime_ns in self._conn.execute(
+                    "SELECT relpath, size, mtime_ns FROM tracks WHERE folder = ?", (folder,)
+                )
+            }
+            row = self._conn.execute(
+                "SELECT track_count FROM folders WHERE folder = ?", (folder,)
+            ).fetchone()
+        removed = [relpath for relpath in stored if relpath not in current]
+        added = [relpath for relpath in current if relpath not in stored]
+        changed = [
+            entry for relpath, entry in current.items()
+            if stored.get(relpath) != (entry.size, entry.mtime_ns)
+        ]
+        result = {
+            "added": [os.path.join(folder, relpath) for relpath in added],
+            "removed": [os.path.join(folder, relpath) for relpath in removed],
+            "updated": len(changed),
+        }
+        if not removed and not changed and row == (len(current),):
+            return result
+        rows = [
+            (folder, entry.relpath, entry.size, entry.mtime_ns, *probe_track(entry.path))
+            for entry in changed
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM tracks WHERE folder = ? AND relpath = ?",
+                [(folder, relpath) for relpath in removed],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO folders VALUES (?, ?)", (folder, len(current))
+            )
+        return result
+
+    def apply_changes(self, folder, added_entries, removed_paths):
+        if not self.is_indexed(folder):
+            return
+        rows = [
+            (folder, entry.relpath, entry.size, entry.mtime_ns, *probe_track(entry.path))
+            for entry in added_entries
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM tracks WHERE folder = ? AND relpath = ?",
+                [(folder, os.path.relpath(path, folder)) for path in removed_paths],
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def remove_folder(self, folder):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM tracks WHERE folder = ?", (folder,))
+            self._conn.execute("DELETE FROM folders WHERE folder = ?", (folder,))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _split(self, path):
+        folder = os.path.dirname(path)
+        relpath = os.path.basename(path)
+        with self._lock:
+            while folder:
+                row = self._conn.execute(
+                    "SELECT 1 FROM folders WHERE folder = ?", (folder,)
+                ).fetchone()
+                if row is not None:
+                    return folder, relpath
+                parent = os.path.dirname(folder)
+                if parent == folder:
+                    break
+                relpath = os.path.join(os.path.basename(folder), relpath)
+                folder = parent
+        return None, None
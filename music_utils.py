@@ -1,27 +1,89 @@
 import os
-import random
-from config import SUPPORTED_FORMATS
+import threading
+from fnmatch import fnmatch
+from collections import namedtuple, OrderedDict
+from config import SUPPORTED_FORMATS, SCAN_RECURSIVE, SCAN_MAX_DEPTH, SCAN_EXCLUDE, DURATION_CACHE_SIZE
 
+MusicEntry = namedtuple("MusicEntry", ["path", "relpath", "name", "size", "mtime_ns"])
+_duration_cache = OrderedDict()
+_duration_lock = threading.Lock()
 
-def validate_and_get_music_files(folder):
+
+def is_music_file(name):
+    return name.lower().endswith(SUPPORTED_FORMATS)
+
+
+def list_music_dir(dir_path, rel_dir="", exclude=SCAN_EXCLUDE):
+    files, subdirs = [], []
+    with os.scandir(dir_path) as it:
+        for entry in it:
+            if any(fnmatch(entry.name, pattern) for pattern in exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.name)
+                elif is_music_file(entry.name) and entry.is_file():
+                    st = entry.stat()
+                    relpath = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                    files.append(MusicEntry(entry.path, relpath, entry.name, st.st_size, st.st_mtime_ns))
+            except OSError:
+                continue
+    return files, subdirs
+
+
+def scan_music_files(folder, recursive=SCAN_RECURSIVE, max_depth=SCAN_MAX_DEPTH, exclude=SCAN_EXCLUDE, dirs=None):
     if not os.path.isdir(folder):
-        return []
-    return [
-        os.path.join(folder, f)
-        for f in os.listdir(folder)
-        if f.lower().endswith(SUPPORTED_FORMATS)
-    ]
+        return
+    stack = [(folder, "", 0)]
+    while stack:
+        dir_path, rel_dir, depth = stack.pop()
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns if dirs is not None else None
+            files, subdirs = list_music_dir(dir_path, rel_dir, exclude)
+        except OSError:
+            continue
+        yield from files
+        if not recursive or (max_depth is not None and depth >= max_depth):
+            subdirs = []
+        if dirs is not None:
+            dirs[dir_path] = (mtime_ns, depth, [entry.path for entry in files], subdirs)
+        for name in subdirs:
+            relpath = os.path.join(rel_dir, name) if rel_dir else name
+            stack.append((os.path.join(dir_path, name), relpath, depth + 1))
 
 
-def create_ordered_playlist(files, mode):
-    files_copy = list(files)
-    if mode == "random":
-        random.shuffle(files_copy)
-    else:
-        files_copy.sort(key=lambda f: os.path.basename(f).lower())
-    return files_copy
+def validate_and_get_music_files(folder):
+    return [entry.path for entry in scan_music_files(folder)]
+
+
+def probe_duration(path):
+    try:
+        from mutagen import File as MutagenFile
+
+        audio = MutagenFile(path)
+        length = audio.info.length if audio is not None else None
+        return length if length and length > 0 else None
+    except Exception:
+        return None
+
+
+def get_duration(path, fallback=None):
+    st = os.stat(path)
+    key = (path, st.st_size, st.st_mtime_ns)
+    with _duration_lock:
+        if key in _duration_cache:
+            _duration_cache.move_to_end(key)
+            return _duration_cache[key]
+    duration = probe_duration(path)
+    if duration is None and fallback is not None:
+        duration = fallback(path)
+    duration = duration or 0.0
+    with _duration_lock:
+        _duration_cache[key] = duration
+        if len(_duration_cache) > DURATION_CACHE_SIZE:
+            _duration_cache.popitem(last=False)
+    return duration
 
 
 def format_time(s):
     return f"{int(s//60):02d}:{int(s%60):02d}" if s >= 0 else "--:--"
-
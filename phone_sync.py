@@ -1,9 +1,17 @@
 import os
 import sys
+import time
+import hashlib
+import uuid
+import queue
+import shlex
+import itertools
+import threading
 import subprocess
+from fnmatch import fnmatch
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from config import SUPPORTED_FORMATS, get_timestr
-from music_utils import validate_and_get_music_files
+from config import SCAN_RECURSIVE, SCAN_MAX_DEPTH, SCAN_EXCLUDE, get_timestr
+from music_utils import is_music_file, scan_music_files
 
 if sys.platform == 'win32':
     CREATE_NO_WINDOW = 0x08000000
@@ -11,6 +19,169 @@ else:
     CREATE_NO_WINDOW = 0
 
 MAX_WORKERS = 8
+ADB_TIMEOUT = 10
+BATCH_MAX_BYTES = 32 * 1024
+VERIFY_CHECKSUMS = False
+
+
+class AdbShell:
+    def __init__(self, adb="adb"):
+        self._proc = subprocess.Popen(
+            [adb, "shell"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            creationflags=CREATE_NO_WINDOW
+        )
+        self._lines = queue.Queue()
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex
+        self._sequence = itertools.count()
+        self.commands = 0
+        threading.Thread(target=self._read_output, daemon=True).start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def alive(self):
+        return self._proc.poll() is None
+
+    def _read_output(self):
+        for line in self._proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def run(self, command, timeout=ADB_TIMEOUT):
+        with self._lock:
+            marker = f"__music_sync_{self._token}_{next(self._sequence)}__"
+            script = f"{{ {command}\n}} </dev/null 2>&1; printf '\\n%s %d\\n' {marker} $?\n"
+            try:
+                self._proc.stdin.write(script.encode("utf-8"))
+                self._proc.stdin.flush()
+            except OSError:
+                self._proc.kill()
+                raise
+            marker = marker.encode("ascii")
+            deadline = time.monotonic() + timeout
+            lines = []
+            while True:
+                try:
+                    line = self._lines.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    self._proc.kill()
+                    raise subprocess.TimeoutExpired(command, timeout)
+                if line is None:
+                    raise BrokenPipeError("adb shell session ended")
+                if line.startswith(marker):
+                    returncode = int(line[len(marker):].strip())
+                    break
+                lines.append(line)
+            self.commands += 1
+        output = b"".join(lines).decode("utf-8", errors="ignore").replace("\r\n", "\n")
+        return subprocess.CompletedProcess(command, returncode, output[:-1] if output.endswith("\n") else output)
+
+    def close(self):
+        if self._proc.poll() is None:
+            try:
+                self._proc.stdin.write(b"exit\n")
+                self._proc.stdin.close()
+                self._proc.wait(timeout=2)
+            except (OSError, subprocess.TimeoutExpired):
+                self._proc.kill()
+        self._proc.wait()
+
+
+class AdbShellPool:
+    def __init__(self, size=MAX_WORKERS, adb="adb"):
+        self.adb = adb
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.sessions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, command, timeout=ADB_TIMEOUT):
+        with self._slots:
+            with self._lock:
+                shell = self._idle.pop() if self._idle else None
+            if shell is None:
+                shell = AdbShell(self.adb)
+                self.sessions += 1
+            try:
+                return shell.run(command, timeout)
+            finally:
+                with self._lock:
+                    if shell.alive and not self._closed:
+                        self._idle.append(shell)
+                        shell = None
+                if shell is not None:
+                    shell.close()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for shell in idle:
+            shell.close()
+
+
+def shell_run(shell, command, timeout=ADB_TIMEOUT):
+    if shell is not None:
+        return shell.run(command, timeout)
+    with AdbShell() as session:
+        return session.run(command, timeout)
+
+
+def chunk_shell_args(paths, max_bytes=BATCH_MAX_BYTES):
+    chunk, size = [], 0
+    for path in paths:
+        quoted = shlex.quote(path)
+        length = len(quoted.encode("utf-8")) + 1
+        if chunk and size + length > max_bytes:
+            yield chunk
+            chunk, size = [], 0
+        chunk.append((path, quoted))
+        size += length
+    if chunk:
+        yield chunk
+
+
+def run_batch(shell, command, paths, timeout=ADB_TIMEOUT):
+    results = {path: False for path in paths if "\0" in path}
+    paths = [path for path in paths if path not in results]
+
+    def run_chunk(chunk):
+        marker = f"__music_batch_{uuid.uuid4().hex}__"
+        script = (
+            f"i=0; for f in {' '.join(quoted for _, quoted in chunk)}; do "
+            f"{command} \"$f\"; printf '%s %d %d\\n' {marker} \"$i\" \"$?\"; i=$((i+1)); done"
+        )
+        statuses = {}
+        try:
+            output = shell_run(shell, script, timeout + len(chunk) / 100).stdout
+        except Exception:
+            output = ""
+        for line in output.split("\n"):
+            if line.startswith(marker):
+                index, returncode = line[len(marker):].split()
+                statuses[int(index)] = int(returncode) == 0
+        return [(path, statuses.get(i, False)) for i, (path, _) in enumerate(chunk)]
+
+    chunks = list(chunk_shell_args(paths))
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, max(1, len(chunks)))) as executor:
+        for chunk_results in executor.map(run_chunk, chunks):
+            results.update(chunk_results)
+    return results
 
 
 def convert_windows_path_to_adb(windows_path):
@@ -59,46 +230,141 @@ def check_adb_connection():
         return False
 
 
-def list_phone_files(phone_path):
+def check_phone_path(phone_path, shell=None):
     try:
-        result = subprocess.run(
-            ["adb", "shell", f"ls -1 '{phone_path}'"],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            timeout=10,
-            creationflags=CREATE_NO_WINDOW
-        )
+        return shell_run(shell, f"ls {shlex.quote(phone_path)}", timeout=5).returncode == 0
+    except Exception:
+        return False
+
+
+def list_phone_files(phone_path, shell=None):
+    try:
+        result = shell_run(shell, f"ls -1 {shlex.quote(phone_path)}")
         if result.returncode == 0 and result.stdout:
             files = [f.strip() for f in result.stdout.strip().split('\n') if f.strip()]
-            music_files = [f for f in files if any(f.lower().endswith(ext) for ext in SUPPORTED_FORMATS)]
+            music_files = [f for f in files if is_music_file(f)]
             return music_files
         return []
     except Exception:
         return []
 
 
-def delete_phone_file(phone_path, filename):
+def phone_relpath(entry):
+    return entry.relpath.replace(os.sep, "/")
+
+
+def phone_scan_depth():
+    if not SCAN_RECURSIVE:
+        return 1
+    return None if SCAN_MAX_DEPTH is None else SCAN_MAX_DEPTH + 1
+
+
+def list_phone_stats(phone_path, shell=None):
+    depth = phone_scan_depth()
+    depth_arg = f" -maxdepth {depth}" if depth is not None else ""
     try:
-        file_path = f"{phone_path}/{filename}"
-        result = subprocess.run(
-            ["adb", "shell", f"rm '{file_path}'"],
-            capture_output=True,
-            text=True,
-            encoding='utf-8',
-            errors='ignore',
-            timeout=10,
-            creationflags=CREATE_NO_WINDOW
+        result = shell_run(
+            shell, f"find {shlex.quote(phone_path)}{depth_arg} -type f -exec stat -c '%s %Y %n' {{}} +"
         )
+    except Exception:
+        return None
+    prefix = phone_path.rstrip("/") + "/"
+    stats = {}
+    for line in result.stdout.split("\n"):
+        fields = line.split(" ", 2)
+        if len(fields) != 3 or not fields[2].startswith(prefix):
+            continue
+        name = fields[2][len(prefix):]
+        parts = name.split("/")
+        if any(fnmatch(part, pattern) for part in parts for pattern in SCAN_EXCLUDE):
+            continue
+        if is_music_file(parts[-1]):
+            stats[name] = (int(fields[0]), int(fields[1]))
+    if not stats and result.returncode != 0:
+        return None
+    return stats
+
+
+def phone_md5sums(phone_path, filenames, shell=None):
+    paths = {f"{phone_path}/{filename}": filename for filename in filenames}
+
+    def run_chunk(chunk):
+        try:
+            output = shell_run(
+                shell, "md5sum " + " ".join(quoted for _, quoted in chunk), ADB_TIMEOUT + len(chunk)
+            ).stdout
+        except Exception:
+            return {}
+        sums = {}
+        for line in output.split("\n"):
+            digest, _, path = line.partition("  ")
+            if path in paths:
+                sums[paths[path]] = digest.lower()
+        return sums
+
+    chunks = list(chunk_shell_args(paths))
+    checksums = {}
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS, max(1, len(chunks)))) as executor:
+        for sums in executor.map(run_chunk, chunks):
+            checksums.update(sums)
+    return checksums
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def plan_phone_sync(local_entries, phone_stats, phone_path=None, shell=None, verify=False):
+    pc_files = {phone_relpath(entry): entry for entry in local_entries}
+    plan = {
+        "delete": sorted(set(phone_stats) - set(pc_files)),
+        "missing": sorted(set(pc_files) - set(phone_stats)),
+        "truncated": [],
+        "changed": [],
+        "mismatched": [],
+    }
+    same_size = []
+    for name in sorted(set(pc_files) & set(phone_stats)):
+        local_size, remote_size = pc_files[name].size, phone_stats[name][0]
+        if local_size is None or remote_size is None or local_size == remote_size:
+            same_size.append(name)
+        elif remote_size < local_size:
+            plan["truncated"].append(name)
+        else:
+            plan["changed"].append(name)
+
+    if verify and same_size:
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            local_sums = dict(zip(same_size, executor.map(lambda name: file_md5(pc_files[name].path), same_size)))
+        remote_sums = phone_md5sums(phone_path, same_size, shell)
+        plan["mismatched"] = [name for name in same_size if remote_sums.get(name) != local_sums[name]]
+
+    plan["upload"] = plan["missing"] + plan["truncated"] + plan["changed"] + plan["mismatched"]
+    return plan
+
+
+def delete_phone_file(phone_path, filename, shell=None):
+    try:
+        file_path = f"{phone_path}/{filename}"
+        result = shell_run(shell, f"rm {shlex.quote(file_path)}")
         return result.returncode == 0
     except Exception:
         return False
 
 
-def copy_file_to_phone(local_path, phone_folder_path):
+def delete_phone_files(phone_path, filenames, shell=None):
+    paths = {f"{phone_path}/{filename}": filename for filename in filenames}
+    results = run_batch(shell, "rm", list(paths))
+    return {paths[path]: ok for path, ok in results.items()}
+
+
+def copy_file_to_phone(local_path, phone_folder_path, relpath=None):
     try:
-        filename = os.path.basename(local_path)
+        filename = relpath or os.path.basename(local_path)
         dest_path = f"{phone_folder_path}/{filename}"
         
         result = subprocess.run(
@@ -116,94 +382,89 @@ def copy_file_to_phone(local_path, phone_folder_path):
         return False
 
 
-def touch_phone_file(phone_path, filename, time_str):
+def touch_phone_file(phone_path, filename, time_str, shell=None):
     try:
         file_path = f"{phone_path}/{filename}"
-        result = subprocess.run(
-            ["adb", "shell", f"touch -c -t {time_str} '{file_path}'"],
-            capture_output=True, text=True, encoding='utf-8', errors='ignore',
-            timeout=5, creationflags=CREATE_NO_WINDOW
-        )
+        result = shell_run(shell, f"touch -c -t {time_str} {shlex.quote(file_path)}", timeout=5)
         return result.returncode
     except Exception:
         return False
 
 
-def process_phone_music_metadata(phone_path):
+def touch_phone_files(phone_path, filenames, time_str, shell=None):
+    paths = {f"{phone_path}/{filename}": filename for filename in filenames}
+    results = run_batch(shell, f"touch -c -t {time_str}", list(paths), timeout=5)
+    return {paths[path]: ok for path, ok in results.items()}
+
+
+def scan_phone_media(phone_path, shell=None):
+    try:
+        result = shell_run(
+            shell,
+            f"am broadcast -a android.intent.action.MEDIA_SCANNER_SCAN_FILE -d {shlex.quote('file://' + phone_path)}"
+        )
+        return result.returncode == 0
+    except Exception:
+        return False
+
+
+def process_phone_music_metadata(phone_path, shell=None, files=None):
+    if shell is None:
+        with AdbShellPool() as pool:
+            return process_phone_music_metadata(phone_path, pool, files)
     try:
         time_str = get_timestr()
         
-        files = list_phone_files(phone_path)
+        if files is None:
+            phone_stats = list_phone_stats(phone_path, shell)
+            files = list(phone_stats) if phone_stats is not None else list_phone_files(phone_path, shell)
         total = len(files)
         
         if total == 0:
             return True
         
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            future_to_filename = {
-                executor.submit(touch_phone_file, phone_path, filename, time_str): filename
-                for filename in files
-            }
-            for future in as_completed(future_to_filename):
-                future.result()
+        touch_phone_files(phone_path, files, time_str, shell)
         
-        result = subprocess.run(
-            ["adb", "shell", f"am broadcast -a android.intent.action.MEDIA_SCANNER_SCAN_FILE -d file://{phone_path}"],
-            capture_output=True,
-            encoding='utf-8',
-            errors='ignore',
-            timeout=10,
-            creationflags=CREATE_NO_WINDOW
-        )
+        scan_phone_media(phone_path, shell)
         return True
     except Exception:
         return False
 
 
-def sync_phone_complete(music_folder, phone_path):
+def sync_phone_complete(music_folder, phone_path, shell=None, verify=None):
+    if shell is None:
+        with AdbShellPool() as pool:
+            return sync_phone_complete(music_folder, phone_path, pool, verify)
+    if verify is None:
+        verify = VERIFY_CHECKSUMS
     try:
-        pc_files = [os.path.basename(f) for f in validate_and_get_music_files(music_folder)]
-        phone_files = list_phone_files(phone_path)
-        
-        pc_set = set(pc_files)
-        phone_set = set(phone_files)
+        local_entries = list(scan_music_files(music_folder))
+        pc_files = {phone_relpath(entry): entry.path for entry in local_entries}
+        phone_stats = list_phone_stats(phone_path, shell)
+        if phone_stats is None:
+            phone_stats = {filename: (None, None) for filename in list_phone_files(phone_path, shell)}
         
-        to_delete = phone_set - pc_set
-        to_upload = pc_set - phone_set
+        plan = plan_phone_sync(local_entries, phone_stats, phone_path, shell, verify)
+        to_delete = plan["delete"]
+        to_upload = plan["upload"]
         
         if to_delete:
-            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                future_to_filename = {
-                    executor.submit(delete_phone_file, phone_path, filename): filename
-                    for filename in to_delete
-                }
-                for future in as_completed(future_to_filename):
-                    future.result()
+            delete_phone_files(phone_path, to_delete, shell)
         
+        deleted = set(to_delete)
+        phone_files = [filename for filename in phone_stats if filename not in deleted]
         if to_upload:
-            time_str = get_timestr()
-            newly_pushed_files = []
-            
             with ThreadPoolExecutor(max_workers=min(4, MAX_WORKERS)) as executor:
                 future_to_filename = {
-                    executor.submit(copy_file_to_phone, os.path.join(music_folder, filename), phone_path): filename
+                    executor.submit(copy_file_to_phone, pc_files[filename], phone_path, filename): filename
                     for filename in to_upload
                 }
                 for future in as_completed(future_to_filename):
                     filename = future_to_filename[future]
-                    if future.result():
-                        newly_pushed_files.append(filename)
-            
-            if newly_pushed_files:
-                with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-                    future_to_filename = {
-                        executor.submit(touch_phone_file, phone_path, filename, time_str): filename
-                        for filename in newly_pushed_files
-                    }
-                    for future in as_completed(future_to_filename):
-                        future.result()
+                    if future.result() and filename not in phone_stats:
+                        phone_files.append(filename)
         
-        process_phone_music_metadata(phone_path)
+        process_phone_music_metadata(phone_path, shell, phone_files)
         return True
         
     except Exception:
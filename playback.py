@@ -0,0 +1,98 @@
+import pygame
+
+STOPPED, PAUSED, PLAYING = "stopped", "paused", "playing"
+MUSIC_END_EVENT = pygame.USEREVENT + 1
+
+
+class PlaybackState:
+    def __init__(self, end_event, on_change=None):
+        self.end_event = end_event
+        self.on_change = on_change
+        self.state = STOPPED
+        self.saved_pos = 0.0
+        self.loaded_path = None
+        self.queued_track = None
+        self.started_ticks = 0
+        self.start_pos = 0.0
+        pygame.mixer.music.set_endevent(end_event)
+
+    @property
+    def song_playing(self):
+        return self.state == PLAYING
+
+    @property
+    def is_paused(self):
+        return self.state != PLAYING
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            if self.on_change:
+                self.on_change(state)
+
+    def position(self):
+        if self.state == PLAYING:
+            return self.saved_pos + max(0, pygame.mixer.music.get_pos()) / 1000.0
+        return self.saved_pos
+
+    def expected_end(self, duration):
+        return self.started_ticks + (duration - self.start_pos) * 1000.0
+
+    def load(self, path):
+        self.queued_track = None
+        self.loaded_path = path
+        pygame.mixer.music.load(path)
+
+    def play(self, start_pos=0.0):
+        try:
+            pygame.mixer.music.play(start=start_pos)
+        except pygame.error:
+            pygame.mixer.music.play()
+            start_pos = 0.0
+        pygame.event.clear(self.end_event)
+        self.saved_pos = start_pos
+        self.started_ticks, self.start_pos = pygame.time.get_ticks(), start_pos
+        self._set_state(PLAYING)
+
+    def halt(self, state=PAUSED):
+        if self.queued_track:
+            pygame.mixer.music.load(self.loaded_path)
+            self.queued_track = None
+        pygame.mixer.music.stop()
+        pygame.event.clear(self.end_event)
+        self._set_state(state)
+
+    def pause(self):
+        self.saved_pos = self.position()
+        self.halt(PAUSED)
+
+    def reset(self, position=0.0, state=PAUSED):
+        self.halt(state)
+        self.saved_pos = position
+
+    def seek(self, position):
+        if self.state == PLAYING:
+            self.play(position)
+        else:
+            self.saved_pos = position
+
+    def queue(self, track):
+        pygame.mixer.music.queue(track["path"])
+        self.queued_track = track
+
+    def advance_to_queued(self):
+        track, self.queued_track = self.queued_track, None
+        self.loaded_path = track["path"]
+        self.saved_pos = 0.0
+        self.started_ticks = pygame.time.get_ticks() - max(0, pygame.mixer.music.get_pos())
+        self.start_pos = 0.0
+        return track
+
+    def on_end_event(self):
+        if self.state != PLAYING:
+            return None, None
+        if self.queued_track:
+            return "advanced", self.advance_to_queued()
+        if pygame.mixer.music.get_busy():
+            return None, None
+        return "ended", None
@@ -0,0 +1,550 @@
+import os
+import queue
+import sqlite3
+import threading
+import pygame
+
+from config import *
+from music_utils import *
+from playlist import *
+from library_index import LibraryIndex
+from folder_watcher import FolderWatcher
+from playback import PlaybackState, STOPPED
+from autosave import AutosaveWriter
+
+EMPTY_PLAYLIST_TITLE = "无音乐, 请浏览文件夹"
+
+
+class PlayerCore:
+    def __init__(self, end_event, on_update=None):
+        app_data = load_app_data()
+        self.global_volume = app_data["global_volume"]
+        self.playlists_data = app_data["playlists"]
+        self.music_folder = app_data["last_active_folder"]
+        self.next_new_playlist_mode = app_data["next_new_playlist_mode"]
+        self.phone_mappings = app_data["phone_mappings"]
+        if not self.music_folder:
+            self.next_new_playlist_mode = "random"
+        self.library_index = LibraryIndex()
+        self.on_update = on_update
+
+        self.current_playlist, self.current_index = Playlist(), 0
+        self.active_playlist_mode = "random"
+        self.active_playlist_seed = None
+        self.duration = 0.0
+        self.volume_before_mute = self.global_volume if self.global_volume > 0 else 1.0
+        self.playback = PlaybackState(end_event, on_change=lambda state: self._emit("state", state))
+
+        self.preload_result = {}
+        self.preload_token = 0
+        self.known_bad_songs = set()
+        self.validation_token = 0
+        self.playback_metrics = {"transitions": 0, "gapless": 0, "last_gap_ms": 0.0, "max_gap_ms": 0.0, "total_gap_ms": 0.0}
+        self.normalize_progress = {"running": False, "done": 0, "total": 0, "errors": 0, "skipped": 0, "error": None}
+        self.normalize_cancel = None
+        self.folder_watcher = None
+        self.watcher_lock = threading.Lock()
+        self.folder_changes = queue.Queue()
+        self.autosave = AutosaveWriter()
+        self.checkpoint_key = None
+        self.checkpoint_mappings = None
+        self.encoded_playlist_key = None
+        self.encoded_playlist = None
+
+    def _emit(self, kind, value):
+        if self.on_update:
+            self.on_update(kind, value)
+
+    def start(self):
+        self.autosave.start()
+        self.set_volume(self.global_volume)
+        self.load_playlist_state(self.music_folder)
+
+    def set_volume(self, level):
+        self.global_volume = max(0.0, min(1.0, level))
+        if self.global_volume > 0.01:
+            self.volume_before_mute = self.global_volume
+        pygame.mixer.music.set_volume(self.global_volume)
+        self._emit("volume", self.global_volume)
+
+    def start_folder_normalization(self, folder_path):
+        if self.normalize_cancel:
+            self.normalize_cancel.set()
+        self.start_folder_watcher(None)
+        if not folder_path or not os.path.isdir(folder_path):
+            return
+        cancel_event = threading.Event()
+        self.normalize_cancel = cancel_event
+        self.normalize_progress.update(running=True, done=0, total=0, errors=0, skipped=0, error=None)
+
+        def on_progress(done, total):
+            if not cancel_event.is_set():
+                self.normalize_progress.update(done=done, total=total)
+
+        def normalize_thread_func():
+            dirs, seed = {}, None
+            try:
+                from init import normalize_music_folder
+
+                report, entries = normalize_music_folder(
+                    folder_path,
+                    progress_callback=on_progress,
+                    is_busy=self.is_file_busy,
+                    cancel_event=cancel_event,
+                    dirs=dirs,
+                )
+                seed = dirs
+                if not cancel_event.is_set():
+                    self.normalize_progress.update(
+                        errors=sum(result["status"] == "error" for result in report),
+                        skipped=sum(result["status"] == "skipped" for result in report),
+                    )
+                    changes = self.library_index.update_folder(folder_path, entries)
+                    if changes["added"] or changes["removed"]:
+                        self.normalize_progress["refresh"] = folder_path
+            except (OSError, RuntimeError, ValueError, sqlite3.Error) as e:
+                if not cancel_event.is_set():
+                    self.normalize_progress["error"] = f"{type(e).__name__}: {e}"
+            finally:
+                self.start_folder_watcher(folder_path, seed, cancel_event)
+                if not cancel_event.is_set():
+                    self.normalize_progress["running"] = False
+
+        threading.Thread(target=normalize_thread_func, daemon=True).start()
+
+    def is_file_busy(self, path):
+        queued = self.playback.queued_track
+        return (
+            path == self.playback.loaded_path
+            or (queued is not None and path == queued["path"])
+            or path == self.preload_result.get("path")
+        )
+
+    def on_folder_change(self, folder_path, added_entries, removed_paths):
+        try:
+            self.library_index.apply_changes(folder_path, added_entries, removed_paths)
+        except Exception:
+            pass
+        self.folder_changes.put((folder_path, [entry.path for entry in added_entries], removed_paths))
+
+    def start_folder_watcher(self, folder_path, dirs=None, cancel_event=None):
+        with self.watcher_lock:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if self.folder_watcher and folder_path and self.folder_watcher.folder == folder_path:
+                return
+            if self.folder_watcher:
+                self.folder_watcher.stop()
+                self.folder_watcher = None
+            if folder_path and os.path.isdir(folder_path):
+                self.folder_watcher = FolderWatcher(folder_path, self.on_folder_change, dirs=dirs)
+                self.folder_watcher.start()
+
+    def apply_folder_changes(self):
+        while True:
+            try:
+                folder_path, added, removed = self.folder_changes.get_nowait()
+            except queue.Empty:
+                return
+            if folder_path != self.music_folder:
+                continue
+            self.known_bad_songs.difference_update(added)
+            was_empty = not self.current_playlist
+            self.current_playlist, self.current_index = apply_playlist_changes(
+                self.current_playlist, self.current_index, added, removed,
+                self.active_playlist_mode, self.active_playlist_seed, folder_path
+            )
+            if was_empty and self.current_playlist and not self.playback.song_playing:
+                self.load_song_info_only(self.current_index)
+
+    def poll(self):
+        refreshed_folder = self.normalize_progress.pop("refresh", None)
+        if refreshed_folder and refreshed_folder == self.music_folder and self.current_playlist:
+            self.current_playlist, self.current_index = compare_and_update_playlist(
+                self.current_playlist, self.list_music_files(self.music_folder), self.current_index,
+                self.active_playlist_mode, self.active_playlist_seed, self.music_folder
+            )
+        self.apply_folder_changes()
+        self.queue_preloaded_track()
+        self.checkpoint()
+
+    def list_music_files(self, folder_path):
+        if self.library_index.is_indexed(folder_path):
+            return self.library_index.get_paths(folder_path)
+        return validate_and_get_music_files(folder_path)
+
+    def get_song_duration(self, song_path):
+        song_duration = self.library_index.get_duration(song_path)
+        if song_duration is None:
+            song_duration = get_duration(
+                song_path, fallback=lambda path: pygame.mixer.Sound(path).get_length()
+            )
+        return song_duration or 0.0
+
+    def store_playlist_state(self, position):
+        folder, playlist, index = self.music_folder, self.current_playlist, self.current_index
+        mode, seed = self.active_playlist_mode, self.active_playlist_seed
+        key = (folder, playlist.version, mode, seed)
+        if key != self.encoded_playlist_key:
+            snapshot = playlist.copy()
+            self.encoded_playlist = Deferred(lambda: encode_playlist_state(
+                snapshot, folder, self.list_music_files(folder), mode, seed, 0, 0.0
+            ))
+            self.encoded_playlist_key = key
+        current = playlist[index] if 0 <= index < len(playlist) else None
+        encoded, cursor = self.encoded_playlist, dict(
+            current=os.path.relpath(current, folder) if current else None,
+            last_index=index,
+            last_position=position,
+        )
+        self.playlists_data[folder] = Deferred(lambda: dict(encoded(), **cursor))
+
+    def load_playlist_state(self, folder_path, process_files=True):
+        self.music_folder = folder_path
+        self.known_bad_songs.clear()
+        self._emit("folder", self.music_folder)
+
+        self.duration, saved_pos = 0.0, 0.0
+        if self.music_folder and process_files:
+            self.start_folder_normalization(self.music_folder)
+        else:
+            self.start_folder_watcher(self.music_folder)
+
+        if self.music_folder and self.music_folder in self.playlists_data:
+            data = self.playlists_data[self.music_folder]
+            all_files = self.list_music_files(self.music_folder)
+            old_playlist, old_index = decode_playlist_state(data, self.music_folder, all_files)
+            saved_pos = data.get("last_position", 0.0)
+            self.active_playlist_mode = data.get("play_mode", "random")
+            self.active_playlist_seed = data.get("seed")
+
+            if self.active_playlist_mode == "random" and self.active_playlist_seed is None:
+                current_song = old_playlist[old_index] if 0 <= old_index < len(old_playlist) else None
+                self.active_playlist_seed = new_playlist_seed()
+                old_playlist = create_ordered_playlist(
+                    old_playlist, "random", self.active_playlist_seed, self.music_folder
+                )
+                old_index = old_playlist.index(current_song) if current_song else 0
+
+            self.current_playlist, self.current_index = compare_and_update_playlist(
+                old_playlist, all_files, old_index, self.active_playlist_mode, self.active_playlist_seed,
+                self.music_folder,
+            )
+
+        elif self.music_folder:
+            all_files = self.list_music_files(self.music_folder)
+            self.active_playlist_mode = self.next_new_playlist_mode
+            self.active_playlist_seed = new_playlist_seed()
+            self.current_playlist = create_ordered_playlist(
+                all_files, self.active_playlist_mode, self.active_playlist_seed, self.music_folder
+            )
+            self.current_index, saved_pos = 0, 0.0
+        else:
+            self.current_playlist, self.current_index, saved_pos = Playlist(), 0, 0.0
+            self.active_playlist_mode = self.next_new_playlist_mode
+
+        self.playback.reset(saved_pos)
+        self._emit("mode", self.active_playlist_mode)
+
+        if not self.current_playlist:
+            self._emit("title", EMPTY_PLAYLIST_TITLE)
+        else:
+            self.load_song_info_only(self.current_index)
+
+    def suspend(self):
+        if self.music_folder and self.current_playlist:
+            self.store_playlist_state(self.playback.position())
+        self.stop_music()
+
+    def open_folder(self, folder_path, process_files=True):
+        was_playing = self.playback.song_playing
+        self.suspend()
+        self.load_playlist_state(folder_path, process_files)
+        if was_playing and self.current_playlist:
+            self.handle_action("play_pause")
+
+    def expected_track_end(self):
+        return self.playback.expected_end(self.duration)
+
+    def record_track_boundary(self, expected_end, started_ticks, gapless):
+        gap_ms = max(0.0, started_ticks - expected_end)
+        self.playback_metrics["transitions"] += 1
+        self.playback_metrics["gapless"] += 1 if gapless else 0
+        self.playback_metrics["last_gap_ms"] = gap_ms
+        self.playback_metrics["max_gap_ms"] = max(self.playback_metrics["max_gap_ms"], gap_ms)
+        self.playback_metrics["total_gap_ms"] += gap_ms
+
+    def reset_preload(self):
+        self.preload_token += 1
+        self.preload_result.clear()
+
+    def stop_music(self):
+        self.playback.halt()
+        self.reset_preload()
+
+    def start_preload(self):
+        self.reset_preload()
+        if not self.current_playlist:
+            return
+        token, playlist, start_idx = self.preload_token, self.current_playlist, self.current_index
+        count = len(playlist)
+        candidates = [
+            ((start_idx + offset) % count, playlist[(start_idx + offset) % count])
+            for offset in range(1, min(count, PRELOAD_LOOKAHEAD) + 1)
+        ]
+
+        def preload_thread_func():
+            for next_idx, path in candidates:
+                if token != self.preload_token:
+                    return
+                try:
+                    if os.path.isfile(path):
+                        track_duration = self.get_song_duration(path)
+                        if token == self.preload_token:
+                            self.preload_result.update(index=next_idx, path=path, duration=track_duration)
+                        return
+                except Exception:
+                    continue
+
+        threading.Thread(target=preload_thread_func, daemon=True).start()
+
+    def queue_preloaded_track(self):
+        if self.playback.queued_track or not self.preload_result or not self.playback.song_playing:
+            return
+        track = dict(self.preload_result)
+        self.preload_result.clear()
+        try:
+            self.playback.queue(track)
+        except pygame.error:
+            pass
+
+    def on_music_end(self):
+        expected_end = self.expected_track_end()
+        outcome, track = self.playback.on_end_event()
+        if outcome == "ended":
+            self.handle_action("next_auto")
+            return
+        if outcome != "advanced":
+            return
+        self.record_track_boundary(expected_end, self.playback.started_ticks, gapless=True)
+
+        next_idx = track["index"]
+        playlist = self.current_playlist
+        if not (0 <= next_idx < len(playlist) and playlist[next_idx] == track["path"]):
+            next_idx = playlist.index(track["path"]) if track["path"] in playlist else self.current_index
+        self.current_index = next_idx
+        self.duration = track["duration"]
+        self._emit("title", os.path.splitext(os.path.basename(track["path"]))[0])
+        self.start_preload()
+
+    def show_empty_playlist(self):
+        self._emit("title", EMPTY_PLAYLIST_TITLE)
+        self.duration = 0.0
+        self.playback.reset(state=STOPPED)
+        self.current_index = 0
+
+    def resolve_playable_index(self, idx, direction=None, stale=None):
+        playlist = self.current_playlist
+        if not playlist:
+            return None
+        count = len(playlist)
+        step = -1 if direction == "prev" else 1
+        start = idx % count
+        for batch_start in range(0, count, VALIDATE_BATCH):
+            for offset in range(batch_start, min(count, batch_start + VALIDATE_BATCH)):
+                position = (start + step * offset) % count
+                path = playlist[position]
+                if path in self.known_bad_songs:
+                    stale.add(path)
+                elif os.path.isfile(path):
+                    return position
+                else:
+                    self.known_bad_songs.add(path)
+                    stale.add(path)
+        return None
+
+    def prune_stale_songs(self, stale):
+        if not stale:
+            return
+        playlist = self.current_playlist
+        current = playlist[self.current_index] if 0 <= self.current_index < len(playlist) else None
+        playlist.remove_many(stale)
+        self.current_index = playlist.index(current) if current in playlist else 0
+
+    def start_validation(self, idx):
+        self.validation_token += 1
+        token = self.validation_token
+        playlist = self.current_playlist[idx + 1:idx + 1 + VALIDATE_AHEAD]
+
+        def validation_thread_func():
+            for batch_start in range(0, len(playlist), VALIDATE_BATCH):
+                if token != self.validation_token:
+                    return
+                for path in playlist[batch_start:batch_start + VALIDATE_BATCH]:
+                    if path not in self.known_bad_songs and not os.path.isfile(path):
+                        self.known_bad_songs.add(path)
+
+        threading.Thread(target=validation_thread_func, daemon=True).start()
+
+    def resume_loaded_song(self):
+        song_path = self.current_playlist[self.current_index] if self.current_playlist else None
+        if not song_path or song_path != self.playback.loaded_path or not os.path.isfile(song_path):
+            return False
+        try:
+            self.playback.play(self.playback.saved_pos)
+        except pygame.error:
+            return False
+        self.start_preload()
+        return True
+
+    def load_and_play_song(self, idx, start_pos=0.0, direction=None):
+        stale = set()
+        while True:
+            next_idx = self.resolve_playable_index(idx, direction, stale)
+            if next_idx is None:
+                self.prune_stale_songs(stale)
+                self.show_empty_playlist()
+                return
+
+            self.current_index = next_idx
+            song_path = self.current_playlist[self.current_index]
+            try:
+                self.reset_preload()
+                self.playback.load(song_path)
+                self.duration = self.get_song_duration(song_path)
+                self.playback.play(start_pos)
+            except (pygame.error, OSError):
+                self.known_bad_songs.add(song_path)
+                stale.add(song_path)
+                idx, start_pos = self.current_index, 0.0
+                continue
+            self.prune_stale_songs(stale)
+            self.start_preload()
+            self.start_validation(self.current_index)
+            self._emit("title", os.path.splitext(os.path.basename(song_path))[0])
+            return
+
+    def load_song_info_only(self, idx, direction=None):
+        stale = set()
+        while True:
+            next_idx = self.resolve_playable_index(idx, direction, stale)
+            if next_idx is None:
+                self.prune_stale_songs(stale)
+                self.show_empty_playlist()
+                return
+
+            self.current_index = next_idx
+            song_path = self.current_playlist[self.current_index]
+            try:
+                self.duration = self.get_song_duration(song_path)
+                self.playback.reset(self.playback.saved_pos)
+            except (pygame.error, OSError):
+                self.known_bad_songs.add(song_path)
+                stale.add(song_path)
+                idx = self.current_index
+                continue
+            self.prune_stale_songs(stale)
+            self.start_validation(self.current_index)
+            self._emit("title", os.path.splitext(os.path.basename(song_path))[0])
+            return
+
+    def seek_music(self, ratio):
+        if self.duration > 0:
+            self.playback.seek(self.duration * ratio)
+
+    def handle_action(self, action):
+        allowed_when_empty = ["toggle_mode", "reset", "toggle_mute"]
+        if not self.current_playlist and action not in allowed_when_empty:
+            return
+
+        if action == "play_pause":
+            if self.playback.is_paused:
+                if not self.resume_loaded_song():
+                    self.load_and_play_song(self.current_index, start_pos=self.playback.saved_pos)
+            else:
+                self.playback.pause()
+                self.reset_preload()
+        elif action in ["prev", "next", "next_auto"]:
+            next_idx = (self.current_index + (-1 if action == "prev" else 1)) % len(self.current_playlist)
+            direction = "prev" if action == "prev" else "next"
+            if action == "next_auto":
+                ended_ticks = min(self.expected_track_end(), pygame.time.get_ticks())
+                self.load_and_play_song(next_idx, start_pos=0.0, direction=direction)
+                if self.playback.song_playing:
+                    self.record_track_boundary(ended_ticks, self.playback.started_ticks, gapless=False)
+            elif self.playback.song_playing:
+                self.load_and_play_song(next_idx, start_pos=0.0, direction=direction)
+            else:
+                self.playback.saved_pos = 0.0
+                self.load_song_info_only(next_idx, direction=direction)
+        elif action == "rewind":
+            if self.duration > 0:
+                self.seek_music(
+                    max(0, (self.playback.position() - FAST_FORWARD_REWIND_STEP) / self.duration)
+                )
+        elif action == "fast_forward":
+            if self.duration > 0:
+                self.seek_music(
+                    min(1, (self.playback.position() + FAST_FORWARD_REWIND_STEP) / self.duration)
+                )
+        elif action == "toggle_mode":
+            self.next_new_playlist_mode = (
+                "sequential" if self.next_new_playlist_mode == "random" else "random"
+            )
+            self._emit("mode", self.next_new_playlist_mode)
+        elif action == "reset":
+            if self.music_folder in self.playlists_data:
+                del self.playlists_data[self.music_folder]
+            self.stop_music()
+            self.next_new_playlist_mode = "random"
+            self.load_playlist_state("", process_files=False)
+        elif action == "toggle_mute":
+            self.set_volume(0.0 if self.global_volume > 0.01 else self.volume_before_mute)
+
+    def status(self):
+        playlist = self.current_playlist
+        return {
+            "state": self.playback.state,
+            "folder": self.music_folder,
+            "index": self.current_index,
+            "count": len(playlist),
+            "track": playlist[self.current_index] if playlist else None,
+            "position": round(self.playback.position(), 3),
+            "duration": round(self.duration, 3),
+            "volume": round(self.global_volume, 3),
+            "mode": self.active_playlist_mode,
+            "normalizing": dict(self.normalize_progress),
+            "metrics": dict(self.playback_metrics),
+            "autosave": self.autosave.stats(),
+        }
+
+    def checkpoint(self, force=False):
+        position = self.playback.position() if pygame.mixer.get_init() else self.playback.saved_pos
+        key = (
+            self.global_volume, self.music_folder, self.next_new_playlist_mode, self.playback.state,
+            self.current_playlist.version, self.current_index, int(position // AUTOSAVE_INTERVAL),
+        )
+        if not force and key == self.checkpoint_key and self.phone_mappings == self.checkpoint_mappings:
+            return
+        self.checkpoint_key = key
+        self.checkpoint_mappings = dict(self.phone_mappings)
+        if self.music_folder and self.current_playlist:
+            self.store_playlist_state(position)
+        changes = self.playlists_data.take_changes()
+        changes[APP_DATA_FILE] = app_settings(
+            self.global_volume, self.music_folder, self.next_new_playlist_mode, self.checkpoint_mappings
+        )
+        self.autosave.submit(changes)
+
+    def save(self):
+        self.checkpoint(force=True)
+        self.autosave.flush()
+
+    def shutdown(self):
+        if self.normalize_cancel:
+            self.normalize_cancel.set()
+        if self.folder_watcher:
+            self.folder_watcher.stop()
+        self.checkpoint(force=True)
+        self.autosave.stop()
+        self.library_index.close()
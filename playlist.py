@@ -0,0 +1,367 @@
+import os
+import heapq
+import random
+import hashlib
+import itertools
+from array import array
+from bisect import bisect_left, bisect_right
+
+_versions = itertools.count(1)
+
+
+def new_playlist_seed():
+    return random.getrandbits(32)
+
+
+def folder_prefix(folder):
+    return os.path.join(folder, "") if folder else ""
+
+
+def folder_relpath(path, prefix):
+    return path[len(prefix):] if path.startswith(prefix) else path
+
+
+def shuffle_key(seed, path, prefix=""):
+    digest = hashlib.blake2b(
+        encode_name(folder_relpath(path, prefix)), digest_size=8, key=seed.to_bytes(4, "little")
+    ).digest()
+    return int.from_bytes(digest, "little"), path
+
+
+def sequential_key(path, prefix=""):
+    return folder_relpath(path, prefix).casefold(), path
+
+
+def playlist_sort_key(mode, seed=None, folder=""):
+    prefix = folder_prefix(folder)
+    if mode == "random" and seed is not None:
+        return lambda path: shuffle_key(seed, path, prefix)
+    return lambda path: sequential_key(path, prefix)
+
+
+def path_prefix(paths):
+    if not paths:
+        return ""
+    prefix = os.path.commonprefix(paths)
+    cut = max(prefix.rfind(sep) for sep in (os.sep, os.altsep or os.sep))
+    return prefix[:cut + 1]
+
+
+def encode_name(name):
+    return name.encode("utf-8", "surrogatepass")
+
+
+class PathTable:
+    __slots__ = ("prefix", "_blob", "_offsets", "_slots", "_mask")
+
+    def __init__(self, prefix="", names=()):
+        self.prefix = prefix
+        self._blob = b"".join(names)
+        self._offsets = array("I" if len(self._blob) < 2 ** 32 else "Q", [0])
+        self._offsets.extend(itertools.accumulate(map(len, names)))
+        size = 8
+        while size < 2 * len(names):
+            size *= 2
+        self._mask = size - 1
+        self._slots = slots = array("I", [0]) * size
+        for name_id, name in enumerate(names, 1):
+            slot = hash(name) & self._mask
+            while slots[slot]:
+                slot = (slot + 1) & self._mask
+            slots[slot] = name_id
+
+    @classmethod
+    def build(cls, paths):
+        prefix = path_prefix(paths)
+        cut = len(prefix)
+        encoded = [encode_name(path[cut:]) for path in paths]
+        ids = dict.fromkeys(encoded)
+        for name_id, name in enumerate(ids):
+            ids[name] = name_id
+        return cls(prefix, list(ids)), array("I", map(ids.__getitem__, encoded))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def name_bytes(self, name_id):
+        return self._blob[self._offsets[name_id]:self._offsets[name_id + 1]]
+
+    def path(self, name_id):
+        return self.prefix + self.name_bytes(name_id).decode("utf-8", "surrogatepass")
+
+    def find(self, path):
+        if not path.startswith(self.prefix):
+            return -1
+        name = encode_name(path[len(self.prefix):])
+        slots, mask = self._slots, self._mask
+        slot = hash(name) & mask
+        while slots[slot]:
+            if self.name_bytes(slots[slot] - 1) == name:
+                return slots[slot] - 1
+            slot = (slot + 1) & mask
+        return -1
+
+
+class Playlist:
+    def __init__(self, paths=(), mode="sequential", seed=None, folder=""):
+        self.mode = mode
+        self.seed = seed
+        self.folder = folder
+        self._sort_key = playlist_sort_key(mode, seed, folder)
+        self._replace(list(paths))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return map(self._table.path, self._order)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return [self._table.path(name_id) for name_id in self._order[idx]]
+        return self._table.path(self._order[idx])
+
+    def __contains__(self, path):
+        return self._position(path) >= 0
+
+    def __repr__(self):
+        return f"Playlist({len(self._order)} songs, mode={self.mode!r})"
+
+    def _position(self, path):
+        name_id = self._table.find(path)
+        return self._positions[name_id] if name_id >= 0 else -1
+
+    def index(self, path):
+        position = self._position(path)
+        if position < 0:
+            raise ValueError(f"{path!r} is not in playlist")
+        return position
+
+    def sort_key(self, path):
+        return self._sort_key(path)
+
+    def copy(self):
+        clone = Playlist.__new__(Playlist)
+        clone.mode, clone.seed, clone.folder, clone._sort_key = self.mode, self.seed, self.folder, self._sort_key
+        clone._table, clone._order, clone._positions = self._table, self._order[:], self._positions[:]
+        clone.version = self.version
+        return clone
+
+    def pop(self, idx=-1):
+        idx = idx % len(self._order)
+        name_id = self._order.pop(idx)
+        self._positions[name_id] = -1
+        self._reindex(idx)
+        self.version = next(_versions)
+        return self._table.path(name_id)
+
+    def remove_many(self, paths):
+        removed = {self._table.find(path) for path in paths if path in self}
+        if not removed:
+            return 0
+        self._set_order(array("I", (name_id for name_id in self._order if name_id not in removed)))
+        return len(removed)
+
+    def _reindex(self, start=0):
+        positions, order = self._positions, self._order
+        for i in range(start, len(order)):
+            positions[order[i]] = i
+
+    def _set_order(self, order):
+        self._order = order
+        self._positions = array("i", [-1]) * len(self._table)
+        self._reindex()
+        self.version = next(_versions)
+
+    def _replace(self, paths):
+        self._table, order = PathTable.build(paths)
+        self._set_order(order)
+
+    def apply_changes(self, current_idx, added_songs, deleted_songs):
+        added_songs = [song for song in set(added_songs) if song not in self]
+        deleted_songs = {song for song in deleted_songs if song in self}
+        if not added_songs and not deleted_songs:
+            return current_idx
+
+        current_song_path = None
+        if 0 <= current_idx < len(self._order):
+            current_song_path = self[current_idx]
+
+        if self.mode == "sequential":
+            key = self._sort_key
+            kept_keys = [key(song) for song in self if song not in deleted_songs]
+            if any(kept_keys[i] > kept_keys[i + 1] for i in range(len(kept_keys) - 1)):
+                kept_keys.sort()
+            merged = [song for _, song in heapq.merge(kept_keys, sorted(map(key, added_songs)))]
+            self._replace(merged)
+            if not merged or current_song_path is None:
+                updated_index = 0
+            elif current_song_path in self:
+                updated_index = self.index(current_song_path)
+            else:
+                updated_index = bisect_right(merged, key(current_song_path), key=key)
+        else:
+            updated_index = current_idx
+            if deleted_songs:
+                kept = []
+                for i, song in enumerate(self):
+                    if song in deleted_songs:
+                        if i < current_idx:
+                            updated_index -= 1
+                    else:
+                        kept.append(song)
+            else:
+                kept = list(self)
+
+            if added_songs:
+                start = min(updated_index + 1, len(kept))
+                random.shuffle(added_songs)
+                slots = sorted(random.randint(start, len(kept)) for _ in added_songs)
+                merged = kept[:start]
+                previous = start
+                for slot, song in zip(slots, added_songs):
+                    merged.extend(kept[previous:slot])
+                    merged.append(song)
+                    previous = slot
+                merged.extend(kept[previous:])
+                kept = merged
+            self._replace(kept)
+
+        if self._order:
+            updated_index = max(0, min(updated_index, len(self._order) - 1))
+        else:
+            updated_index = 0
+        return updated_index
+
+
+def create_ordered_playlist(files, mode, seed=None, folder=""):
+    files_copy = list(files)
+    if mode == "random" and seed is None:
+        random.shuffle(files_copy)
+    else:
+        files_copy.sort(key=playlist_sort_key(mode, seed, folder))
+    return Playlist(files_copy, mode, seed, folder)
+
+
+def compare_and_update_playlist(old_playlist, new_files, current_idx, current_mode, seed=None, folder=""):
+    if not old_playlist:
+        return create_ordered_playlist(new_files, current_mode, seed, folder), 0
+
+    new_set, old_set = set(new_files), set(old_playlist)
+    if not isinstance(old_playlist, Playlist) or old_playlist.mode != current_mode:
+        old_playlist = Playlist(old_playlist, current_mode, seed, folder)
+    return apply_playlist_changes(
+        old_playlist,
+        current_idx,
+        list(new_set - old_set),
+        list(old_set - new_set),
+        current_mode,
+        seed,
+        folder,
+    )
+
+
+def apply_playlist_changes(old_playlist, current_idx, added_songs, deleted_songs, current_mode, seed=None, folder=""):
+    if not old_playlist:
+        return create_ordered_playlist(added_songs, current_mode, seed, folder), 0
+
+    if not isinstance(old_playlist, Playlist) or old_playlist.mode != current_mode:
+        old_playlist = Playlist(old_playlist, current_mode, seed, folder)
+    updated_index = old_playlist.apply_changes(current_idx, added_songs, deleted_songs)
+    return old_playlist, updated_index
+
+
+def longest_ordered_subsequence(keys):
+    tails, tail_positions, previous = [], [], [-1] * len(keys)
+    for i, key in enumerate(keys):
+        j = bisect_left(tails, key)
+        if j == len(tails):
+            tails.append(key)
+            tail_positions.append(i)
+        else:
+            tails[j] = key
+            tail_positions[j] = i
+        previous[i] = tail_positions[j - 1] if j > 0 else -1
+    kept = set()
+    i = tail_positions[-1] if tail_positions else -1
+    while i >= 0:
+        kept.add(i)
+        i = previous[i]
+    return kept
+
+
+def encode_playlist_state(playlist, folder, base_files, mode, seed, current_idx, position):
+    if isinstance(playlist, Playlist) and (playlist.mode, playlist.seed, playlist.folder) == (mode, seed, folder):
+        sort_key = playlist.sort_key
+    else:
+        sort_key = playlist_sort_key(mode, seed, folder)
+    base_set = set(base_files)
+    in_base = [i for i, path in enumerate(playlist) if path in base_set]
+    kept = {in_base[i] for i in longest_ordered_subsequence([sort_key(playlist[i]) for i in in_base])}
+
+    prefix = folder_prefix(folder)
+    playlist_set = set(playlist)
+    added, anchor = [], None
+    for i, path in enumerate(playlist):
+        name = folder_relpath(path, prefix)
+        if i not in kept:
+            added.append([anchor, name])
+        anchor = name
+
+    current = playlist[current_idx] if 0 <= current_idx < len(playlist) else None
+    return {
+        "play_mode": mode,
+        "seed": seed,
+        "removed": sorted(folder_relpath(path, prefix) for path in base_set - playlist_set),
+        "added": added,
+        "current": folder_relpath(current, prefix) if current else None,
+        "last_index": current_idx,
+        "last_position": position,
+    }
+
+
+def decode_playlist_state(state, folder, base_files):
+    if "song_list" in state:
+        playlist = list(state["song_list"])
+        return playlist, state.get("last_index", 0)
+
+    mode = state.get("play_mode", "random")
+    added = state.get("added", [])
+    prefix = folder_prefix(folder)
+    excluded = {prefix + name for name in state.get("removed", [])}
+    excluded.update(prefix + name for _, name in added)
+    canonical = sorted(
+        (path for path in base_files if path not in excluded),
+        key=playlist_sort_key(mode, state.get("seed"), folder),
+    )
+
+    follows = {anchor: name for anchor, name in added}
+    playlist = []
+
+    def emit_chain(anchor):
+        while anchor in follows:
+            anchor = follows.pop(anchor)
+            playlist.append(prefix + anchor)
+
+    emit_chain(None)
+    if follows:
+        anchors = {prefix + anchor: anchor for anchor in follows if anchor is not None}
+        for path in canonical:
+            playlist.append(path)
+            if path in anchors:
+                emit_chain(anchors[path])
+        for anchor in list(follows):
+            emit_chain(anchor)
+    else:
+        playlist.extend(canonical)
+
+    current_idx = state.get("last_index", 0)
+    current = state.get("current")
+    if current:
+        current_path = prefix + current
+        if not (0 <= current_idx < len(playlist) and playlist[current_idx] == current_path):
+            try:
+                current_idx = playlist.index(current_path)
+            except ValueError:
+                pass
+    return playlist, current_idx
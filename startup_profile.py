@@ -0,0 +1,31 @@
+import os
+import sys
+import time
+
+_started = time.perf_counter()
+_last = _started
+phases = []
+
+
+def enabled():
+    return "--profile-startup" in sys.argv[1:] or bool(os.environ.get("MUSIC_STARTUP_PROFILE"))
+
+
+def mark(phase):
+    global _last
+    now = time.perf_counter()
+    phases.append((phase, now - _last))
+    _last = now
+
+
+def report():
+    if not enabled():
+        return
+    lines = [f"{phase:<14}{elapsed * 1000:9.1f} ms" for phase, elapsed in phases]
+    lines.append(f"{'total':<14}{(_last - _started) * 1000:9.1f} ms")
+    target = os.environ.get("MUSIC_STARTUP_PROFILE", "")
+    if target and target != "1":
+        with open(target, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n\n")
+    elif sys.stderr:
+        print("\n".join(lines), file=sys.stderr)
@@ -0,0 +1,61 @@
+import os
+
+from playlist import create_ordered_playlist, decode_playlist_state, encode_playlist_state
+
+
+def album_library(folder, albums=5, tracks=3):
+    return [
+        os.path.join(folder, f"Album{album}", f"{track:02d} Track.flac")
+        for album in range(albums)
+        for track in range(1, tracks + 1)
+    ]
+
+
+def adjacent_same_names(playlist):
+    names = [os.path.basename(path) for path in playlist]
+    return sum(a == b for a, b in zip(names, names[1:]))
+
+
+def test_shuffle_spreads_tracks_with_the_same_name():
+    folder = os.path.join(os.sep, "music")
+    files = album_library(folder)
+    counts = [adjacent_same_names(create_ordered_playlist(files, "random", seed, folder)) for seed in range(20)]
+    assert max(counts) < 12
+    assert sum(counts) / len(counts) < 8
+
+
+def test_sequential_plays_each_folder_in_order():
+    folder = os.path.join(os.sep, "music")
+    files = album_library(folder)
+    playlist = create_ordered_playlist(reversed(files), "sequential", folder=folder)
+    assert list(playlist) == files
+
+
+def test_shuffle_order_depends_on_folder_relative_paths():
+    first, second = os.path.join(os.sep, "music"), os.path.join(os.sep, "backup", "music")
+    order = [
+        [os.path.relpath(path, folder) for path in create_ordered_playlist(album_library(folder), "random", 7, folder)]
+        for folder in (first, second)
+    ]
+    assert order[0] == order[1]
+
+
+def test_shuffle_state_round_trips():
+    folder = os.path.join(os.sep, "music")
+    files = album_library(folder)
+    playlist = create_ordered_playlist(files, "random", 42, folder)
+    state = encode_playlist_state(playlist, folder, files, "random", 42, 4, 1.5)
+    assert state["added"] == [] and state["removed"] == []
+    assert decode_playlist_state(state, folder, files) == (list(playlist), 4)
+
+
+def test_edited_shuffle_state_round_trips():
+    folder = os.path.join(os.sep, "music")
+    files = album_library(folder, albums=8, tracks=6)
+    playlist = create_ordered_playlist(files, "random", 3, folder)
+    moved = playlist.pop(20)
+    playlist.pop(4)
+    order = list(playlist)
+    order.insert(2, moved)
+    state = encode_playlist_state(order, folder, files, "random", 3, 2, 0.0)
+    assert decode_playlist_state(state, folder, files) == (order, 2)
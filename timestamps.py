@@ -0,0 +1,93 @@
+import os
+import sys
+import stat
+
+TIME_TOLERANCE_NS = 2 * 10**9
+
+
+def to_ns(target_time):
+    return int(target_time.timestamp()) * 10**9
+
+
+def is_stamped(st, target_ns):
+    return abs(st.st_mtime_ns - target_ns) < TIME_TOLERANCE_NS
+
+
+class PosixTimeBackend:
+    def __init__(self):
+        self.use_dir_fd = os.utime in os.supports_dir_fd and os.stat in os.supports_dir_fd
+
+    def stamp(self, folder_path, names, target_time):
+        target_ns = to_ns(target_time)
+        result = {"stamped": 0, "skipped": 0, "errors": {}}
+        dir_fd = None
+        if self.use_dir_fd:
+            try:
+                dir_fd = os.open(folder_path, os.O_RDONLY | getattr(os, "O_DIRECTORY", 0))
+            except OSError:
+                dir_fd = None
+        try:
+            for name in names:
+                path = name if dir_fd is not None else os.path.join(folder_path, name)
+                try:
+                    if is_stamped(os.stat(path, dir_fd=dir_fd), target_ns):
+                        result["skipped"] += 1
+                        continue
+                    os.utime(path, ns=(target_ns, target_ns), dir_fd=dir_fd)
+                    result["stamped"] += 1
+                except OSError as e:
+                    result["errors"][name] = f"{type(e).__name__}: {e}"
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
+        return result
+
+
+class Win32TimeBackend:
+    def stamp(self, folder_path, names, target_time):
+        import win32file
+        import pywintypes
+
+        target_ns = to_ns(target_time)
+        win_time = pywintypes.Time(target_time)
+        result = {"stamped": 0, "skipped": 0, "errors": {}}
+        for name in names:
+            file_path = os.path.join(folder_path, name)
+            handle = None
+            try:
+                st = os.stat(file_path)
+                if is_stamped(st, target_ns) and abs(getattr(st, "st_birthtime_ns", st.st_ctime_ns) - target_ns) < TIME_TOLERANCE_NS:
+                    result["skipped"] += 1
+                    continue
+
+                if not os.access(file_path, os.W_OK):
+                    os.chmod(file_path, stat.S_IWRITE)
+
+                handle = win32file.CreateFile(
+                    file_path,
+                    win32file.GENERIC_WRITE,
+                    win32file.FILE_SHARE_READ | win32file.FILE_SHARE_WRITE,
+                    None,
+                    win32file.OPEN_EXISTING,
+                    win32file.FILE_ATTRIBUTE_NORMAL,
+                    None
+                )
+                win32file.SetFileTime(handle, win_time, win_time, win_time)
+                result["stamped"] += 1
+
+            except Exception as e:
+                result["errors"][name] = f"{type(e).__name__}: {e}"
+            finally:
+                if handle:
+                    win32file.CloseHandle(handle)
+        return result
+
+
+def get_time_backend():
+    if sys.platform == 'win32':
+        return Win32TimeBackend()
+    return PosixTimeBackend()
+
+
+def stamp_files(folder_path, names, target_time, backend=None):
+    return (backend or get_time_backend()).stamp(folder_path, names, target_time)